@@ -1,9 +1,9 @@
 import os
-from base64 import b64decode, b64encode
 
 from .. import helper
 from ..MetaDataObject.core.Simple import Simple
 from ..ext_exception import ExtException
+from ..json_container_decoder import Base64Blob
 
 
 class CommonPicture(Simple):
@@ -17,7 +17,7 @@ class CommonPicture(Simple):
         try:
             super().decode_object(src_dir, file_name, dest_dir, dest_path, version, header_data)
             try:
-                self.header['info'] = helper.brace_file_read(src_dir, f'{self.header["uuid"]}.0')
+                self.header['info'] = helper.brace_file_read(src_dir, f'{self.header["uuid"]}.0', lazy_base64=True)
             except FileNotFoundError:
                 return
             if self.header['info'][0][2] and self.header['info'][0][2][0] and self.header['info'][0][2][0][0]:
@@ -34,8 +34,8 @@ class CommonPicture(Simple):
 
         extension = helper.get_extension_from_comment(self.header['comment'])
         try:
-            bin_data = helper.bin_read(src_dir, f'{file_name}.{extension}')
-            self.header['info'][0][2][0][0] += b64encode(bin_data).decode(encoding='utf-8')
+            bin_data = Base64Blob.from_file(src_dir, f'{file_name}.{extension}')
+            self._append_b64_data(self.header['info'][0][2][0], bin_data)
             file_name = f'{self.header["uuid"]}.0'
             helper.brace_file_write(self.header['info'], dest_dir, file_name)
             self.file_list.append(file_name)
@@ -8,7 +8,7 @@ from enum import Enum
 from v8unpack.MetaDataObject.core.Simple import Simple
 from v8unpack import helper
 from v8unpack.ext_exception import ExtException, ExtNotImplemented
-from v8unpack.json_container_decoder import BigBase64
+from v8unpack.json_container_decoder import BigBase64, Base64Blob
 
 
 class TmplType(Enum):
@@ -110,7 +110,7 @@ class Template2(Simple):
     def decode_base64_data(self, src_dir, dest_dir, write):
         filename = f'{self.header["uuid"]}.0'
         try:
-            data = helper.brace_file_read(src_dir, filename)
+            data = helper.brace_file_read(src_dir, filename, lazy_base64=True)
         except BigBase64:
             shutil.copy2(os.path.join(src_dir, filename),
                          os.path.join(self.new_dest_dir, f'{self.new_dest_file_name}.c1b64'))
@@ -125,7 +125,9 @@ class Template2(Simple):
                 )
             return
         if data[0][1] and data[0][1][0]:
-            self.data = b64decode(data[0][1][0][8:])
+            self.data = data[0][1][0]
+            if not isinstance(self.data, Base64Blob):
+                self.data = b64decode(self.data[8:])
             data[0][1][0] = '"данные в отдельном файле"'
             if write:
                 extension = helper.get_extension_from_comment(self.header['comment'])
@@ -198,7 +200,7 @@ class Template2(Simple):
     def encode_base64_data(self, src_dir, file_name, dest_dir):
         extension = helper.get_extension_from_comment(self.header['comment'])
         try:
-            bin_data = helper.bin_read(src_dir, f'{file_name}.{extension}')
+            bin_data = Base64Blob.from_file(src_dir, f'{file_name}.{extension}')
             self._encode_bin_data(bin_data, dest_dir)
         except FileNotFoundError:
             file_name = f'{file_name}.c1b64'
@@ -203,7 +203,7 @@ class MetaDataObject(MetaObject):
         self.new_dest_path = os.path.join(dest_path, self.header['name'])
         self.new_dest_dir = os.path.join(dest_dir, self.new_dest_path)
         self.new_dest_file_name = self.get_obj_name()
-        helper.makedirs(self.new_dest_dir)
+        helper.makedirs(self.new_dest_dir, exist_ok=True)  # при инкрементальном разборе папка уже может быть
         # self.set_mode_decode_in_name_folder(dest_dir, dest_path)
 
     # def set_write_decode_mode(self, dest_dir, dest_path):
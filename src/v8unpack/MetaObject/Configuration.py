@@ -1,7 +1,7 @@
 import os
-from base64 import b64encode
 
 from .. import helper
+from ..json_container_decoder import Base64Blob
 from ..MetaObject import MetaObject
 from ..ext_exception import ExtException
 from ..metadata_types import MetaDataTypes, MetaDataGroup
@@ -126,7 +126,8 @@ class Configuration(MetaObject):
         if self._images:
             for elem in self._images:
                 try:
-                    data = helper.brace_file_read(src_dir, f'{self.header["uuid"]}.{self._images[elem]}')
+                    data = helper.brace_file_read(src_dir, f'{self.header["uuid"]}.{self._images[elem]}',
+                                                  lazy_base64=True)
                 except FileNotFoundError:
                     return
                 try:
@@ -141,12 +142,12 @@ class Configuration(MetaObject):
         if self._images:
             for elem in self._images:
                 try:
-                    bin_data = helper.bin_read(src_dir, f'{elem}')
+                    bin_data = Base64Blob.from_file(src_dir, f'{elem}')
                 except FileNotFoundError:
                     bin_data = None
                 header = self.header.get(f'image_{elem}')
                 if header and len(header[0]) > 1 and bin_data:
-                    header[0][2][0][0] += b64encode(bin_data).decode(encoding='utf-8')
+                    self._append_b64_data(header[0][2][0], bin_data)
                 if header:
                     file_name = f'{self.header["uuid"]}.{self._images[elem]}'
                     helper.brace_file_write(header, dest_dir, file_name)
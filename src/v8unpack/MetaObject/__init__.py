@@ -6,6 +6,7 @@ from uuid import uuid4
 
 from .. import helper
 from ..ext_exception import ExtException
+from ..json_container_decoder import Base64Blob
 from ..metadata_types import MetaDataTypes
 
 
@@ -102,7 +103,7 @@ class MetaObject:
                 obj_data = _metadata[j + 2]
                 if isinstance(obj_data, str):
                     if j == 0:
-                        os.mkdir(os.path.join(dest_dir, new_dest_path))
+                        helper.makedirs(os.path.join(dest_dir, new_dest_path), exist_ok=True)
 
                     tasks.append([metadata_type.name,
                                   [src_dir, obj_data, dest_dir, new_dest_path, self.container_uuid, self.options]])
@@ -115,7 +116,7 @@ class MetaObject:
                     except Exception as err:
                         continue
                     if j == 0:
-                        os.mkdir(os.path.join(dest_dir, new_dest_path))
+                        helper.makedirs(os.path.join(dest_dir, new_dest_path), exist_ok=True)
                     obj_uuid = handler.decode_internal_include(self, obj_data, src_dir, dest_dir, new_dest_path,
                                                                self.options)
                     if not auto_include:
@@ -398,7 +399,7 @@ class MetaObject:
                     os.path.join(dest_dir, f'{dest_file_name}.bin')
                 )
                 return
-            data = helper.brace_file_read(src_dir, file_name)
+            data = helper.brace_file_read(src_dir, file_name, lazy_base64=True)
         except FileNotFoundError:
             return
         try:
@@ -410,7 +411,10 @@ class MetaObject:
         self.header[header_field] = data
 
     def _extract_b64_data(self, raw_data):
-        if raw_data[0].startswith('##base64:'):
+        if isinstance(raw_data[0], Base64Blob):
+            bin_data = raw_data[0]
+            raw_data[0] = bin_data.prefix
+        elif raw_data[0].startswith('##base64:'):
             bin_data = b64decode(raw_data[0][9:])
             raw_data[0] = '##base64:'
         elif raw_data[0].startswith('#base64:'):
@@ -426,7 +430,7 @@ class MetaObject:
     def _encode_html_data(self, src_dir, file_name, dest_dir, *, header_field='html', file_number=0, extension='html'):
         dest_file_name = f'{self.header["uuid"]}.{file_number}'
         try:
-            bin_data = helper.bin_read(src_dir, f'{file_name}.{extension}')
+            bin_data = Base64Blob.from_file(src_dir, f'{file_name}.{extension}')
         except FileNotFoundError:
             try:
                 shutil.copy2(
@@ -439,17 +443,30 @@ class MetaObject:
                 bin_data = None
         header = self.header.get(header_field)
         if header and len(header[0]) > 2 and bin_data:
-            header[0][3][0] += b64encode(bin_data).decode(encoding='utf-8')
+            self._append_b64_data(header[0][3], bin_data)
         if header:
             self.file_list.append(dest_file_name)
             helper.brace_file_write(header, dest_dir, dest_file_name)
 
+    @staticmethod
+    def _append_b64_data(raw_data, bin_data):
+        """
+        Дописывает двоичные данные к префиксу base64, обратное _extract_b64_data.
+        Файл данных кодируется только при записи скобкофайла, если от содержимого не зависит перенос строк
+
+        :type bin_data: Base64Blob
+        """
+        bin_data.prefix = raw_data[0]
+        raw_data[0] = bin_data if bin_data.prefix in Base64Blob.PREFIXES else str(bin_data)
+
     @staticmethod
     def _get_b64_string(bin_data):
         if not bin_data:
             return "##base64:"
-        else:
-            return "#base64:" + b64encode(bin_data).decode(encoding='utf-8')
+        if isinstance(bin_data, Base64Blob):
+            bin_data.prefix = "#base64:"
+            return bin_data
+        return "#base64:" + b64encode(bin_data).decode(encoding='utf-8')
 
     def _decode_info(self, src_dir, dest_dir, dest_file_name):
         if self._obj_info:
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import pickle
+import shutil
+import threading
+from hashlib import blake2b
+
+from .version import __version__
+
+# Версия формата записей кэша сборки, при изменении структуры старые записи игнорируются
+BUILD_CACHE_VERSION = 1
+# Ограничение на суммарный размер кэша сборки по умолчанию
+DEFAULT_MAX_SIZE = 0x40000000
+# Размер блока чтения файлов при подсчете хэша
+HASH_CHUNK_SIZE = 0x100000
+# Файл записи с ее размером на диске (байт), по нему вытесняются записи без обхода их файлов
+ENTRY_SIZE_FILE = 'size'
+
+
+class BuildCache:
+    """
+    Дисковый кэш сборки объектов метаданных. Ключ записи - хэш папки объекта в encode_stage_3
+    (после раскладки по индексу и наследованию), параметров сборки и положения объекта в родителе.
+
+    Запись хранит результат сборки объекта для заголовка родителя, созданные им файлы encode_stage_1,
+    их сжатые потоки из encode_stage_0 и ключи вложенных объектов. Неизменившийся объект вместе со всеми
+    вложенными объектами восстанавливается копированием файлов, без сборки и сжатия.
+
+    :param cache_dir: папка кэша
+    :type cache_dir: string
+    :param max_size: максимальный суммарный размер записей кэша (байт)
+    :type max_size: int
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.objects = []
+        self.compressed = {}
+
+    @classmethod
+    def from_options(cls, options):
+        """
+        Кэш сборки лежит в подпапке build папки кэша из параметра cache
+
+        :return: кэш сборки или None если папка кэша не задана
+        """
+        try:
+            return cls(os.path.join(options['cache'], 'build'))
+        except (TypeError, KeyError):
+            return None
+
+    @staticmethod
+    def get_key(params):
+        """
+        :param params: задание сборки вложенного объекта (Decoder.encode_include)
+        :rtype: string
+        """
+        include_type, (src_dir, entry, dest_dir, options, parent_id, parent_container_uuid, include_index) = params
+        digest = blake2b(json.dumps(
+            [BUILD_CACHE_VERSION, __version__, include_type, entry, parent_id, parent_container_uuid, options],
+            ensure_ascii=False, sort_keys=True, default=str).encode(), digest_size=20)
+        for root, dirs, files in os.walk(src_dir):
+            dirs.sort()
+            for file_name in sorted(files):
+                path = os.path.join(root, file_name)
+                digest.update(f'{os.path.relpath(path, src_dir)}:{os.path.getsize(path)}\n'.encode())
+                with open(path, 'rb') as file:
+                    while True:
+                        buffer = file.read(HASH_CHUNK_SIZE)
+                        if not buffer:
+                            break
+                        digest.update(buffer)
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _load_entry(self, key):
+        try:
+            with open(os.path.join(self._entry_path(key), 'entry.pickle'), 'rb') as file:
+                return pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # запись повреждена или записана другой версией - собираем объект заново
+            shutil.rmtree(self._entry_path(key), ignore_errors=True)
+            return None
+
+    def restore(self, key, dest_dir):
+        """
+        Восстанавливает файлы объекта и всех его вложенных объектов в папку сборки.
+        Вызывается в процессе пула
+
+        :return: результат сборки объекта, в file_list все восстановленные файлы, в compressed - пути
+            их сжатых потоков, или None если в кэше нет объекта или одного из вложенных объектов
+        :rtype: dict
+        """
+        entries = []
+        stack = [key]
+        while stack:
+            _key = stack.pop()
+            entry = self._load_entry(_key)
+            if entry is None:
+                return None
+            entries.append((_key, entry))
+            stack.extend(entry['children'])
+        file_list = []
+        compressed = {}
+        try:
+            for _key, entry in entries:
+                entry_path = self._entry_path(_key)
+                for file_name in entry['files']:
+                    src_path = os.path.join(entry_path, '1', file_name)
+                    dest_path = os.path.join(dest_dir, file_name)
+                    if os.path.isdir(src_path):
+                        shutil.copytree(src_path, dest_path)
+                    else:
+                        shutil.copyfile(src_path, dest_path)
+                    file_list.append(file_name)
+                    compressed[os.path.abspath(dest_path)] = os.path.join(entry_path, '0', file_name)
+                os.utime(entry_path)  # для вытеснения давно не использованных записей
+        except OSError:
+            # запись вытеснена другим процессом во время восстановления
+            for file_name in file_list:
+                dest_path = os.path.join(dest_dir, file_name)
+                if os.path.isdir(dest_path):
+                    shutil.rmtree(dest_path, ignore_errors=True)
+                else:
+                    os.remove(dest_path)
+            return None
+        result = dict(entries[0][1]['object'])
+        result['cache_key'] = key
+        result['file_list'] = file_list
+        result['compressed'] = compressed
+        return result
+
+    def add_objects(self, objects, dest_dir):
+        """
+        Запоминает собранные объекты, они сохраняются в кэш после сжатия (save)
+
+        :param objects: результаты сборки вложенных объектов с ключами кэша
+        :param dest_dir: папка контейнера в encode_stage_1
+        """
+        for obj in objects:
+            if 'cache_key' not in obj:
+                continue
+            if 'compressed' in obj:
+                self.compressed.update(obj['compressed'])
+            self.objects.append((obj, os.path.abspath(dest_dir)))
+
+    def save(self, src_dir, dest_dir):
+        """
+        Сохраняет в кэш собранные заново объекты
+
+        :param src_dir: encode_stage_1
+        :param dest_dir: encode_stage_0
+        """
+        children = {}
+        for obj, container_dir in self.objects:
+            children.setdefault(obj['parent_id'], []).append(obj['cache_key'])
+        src_dir = os.path.abspath(src_dir)
+        for obj, container_dir in self.objects:
+            if 'compressed' in obj:
+                continue
+            compressed_dir = os.path.join(dest_dir, os.path.relpath(container_dir, src_dir))
+            entry = dict(
+                object={name: value for name, value in obj.items() if name not in ('file_list', 'cache_key')},
+                files=obj['file_list'],
+                children=children.get(obj['obj_id'], [])
+            )
+            self._save_entry(obj['cache_key'], entry, container_dir, compressed_dir)
+        self.evict()
+
+    def _save_entry(self, key, entry, container_dir, compressed_dir):
+        entry_path = self._entry_path(key)
+        if os.path.isdir(entry_path):
+            return
+        temp_path = f'{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        shutil.rmtree(temp_path, ignore_errors=True)
+        for file_name in entry['files']:
+            src_path = os.path.join(container_dir, file_name)
+            if os.path.isdir(src_path):
+                shutil.copytree(src_path, os.path.join(temp_path, '1', file_name))
+            else:
+                os.makedirs(os.path.join(temp_path, '1'), exist_ok=True)
+                shutil.copyfile(src_path, os.path.join(temp_path, '1', file_name))
+            os.makedirs(os.path.join(temp_path, '0'), exist_ok=True)
+            shutil.copyfile(os.path.join(compressed_dir, file_name), os.path.join(temp_path, '0', file_name))
+        os.makedirs(temp_path, exist_ok=True)
+        with open(os.path.join(temp_path, 'entry.pickle'), 'wb') as file:
+            pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._write_entry_size(temp_path)
+        try:
+            os.rename(temp_path, entry_path)
+        except OSError:  # запись уже сохранил другой процесс
+            shutil.rmtree(temp_path, ignore_errors=True)
+
+    def evict(self):
+        """
+        Удаляет давно сохраненные записи, пока суммарный размер кэша больше max_size.
+        Размер записи берется из ее файла size, файлы записей не обходятся
+        """
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_dir() or entry.name.endswith('.tmp'):
+                continue
+            size = self._read_entry_size(entry.path)
+            entries.append((entry.stat().st_mtime, size, entry.path))
+            total_size += size
+        for mtime, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total_size -= size
+
+    @staticmethod
+    def _write_entry_size(entry_path):
+        size = 0
+        for root, dirs, files in os.walk(entry_path):
+            for file_name in files:
+                size += os.path.getsize(os.path.join(root, file_name))
+        with open(os.path.join(entry_path, ENTRY_SIZE_FILE), 'w', encoding='utf-8') as file:
+            file.write(str(size))
+        return size
+
+    @classmethod
+    def _read_entry_size(cls, entry_path):
+        try:
+            with open(os.path.join(entry_path, ENTRY_SIZE_FILE), encoding='utf-8') as file:
+                return int(file.read())
+        except (OSError, ValueError):
+            # запись сохранена без размера - считаем его один раз
+            try:
+                return cls._write_entry_size(entry_path)
+            except OSError:  # запись удаляется другим процессом
+                return 0
@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 import collections
 import datetime
-import io
 import math
 import os
 import tempfile
@@ -9,20 +8,23 @@ import zlib
 from datetime import datetime, timedelta
 from struct import pack, calcsize
 # -*- coding: utf-8 -*-
-from struct import unpack
+from struct import unpack, unpack_from
 
 from tqdm import tqdm
 
-from .container_doc import Document
-from .helper import clear_dir, file_size
+from .container_doc import Document, LazyDocument, DeflateWriter, BUFFER_CHUNK_SIZE
+from .helper import clear_dir
 
 Header = collections.namedtuple('Header', 'first_empty_block_offset, default_block_size, count_files')
 Block = collections.namedtuple('Block', 'doc_size, current_block_size, next_block_offset, data')
-File = collections.namedtuple('File', 'name, size, created, modified, data')
+File = collections.namedtuple('File', 'name, size, created, modified, data, offset', defaults=(None,))
 DocumentData = collections.namedtuple('DocumentData', 'size, data')
 
-# Размер буффера передачи данных из потока в поток
-BUFFER_CHUNK_SIZE = 512
+# Первые байты файла, являющегося контейнером
+CONTAINER_SIGNATURE = b'\xFF\xFF\xFF\x7F'
+
+# Вложенные контейнеры большего размера разбираются через временный файл, а не в памяти
+NESTED_CONTAINER_MEMORY_LIMIT = 0x4000000
 
 
 class Container:
@@ -61,6 +63,38 @@ class Container:
         #: Список файлов в контейнере
         self.files = self.read_files(self.file)
 
+    def get_state(self):
+        """
+        Возвращает прочитанное состояние контейнера для кэша индексов: заголовок и оглавление
+
+        :rtype: dict
+        """
+        return dict(
+            offset=self.offset,
+            size=self.size,
+            first_empty_block_offset=self.first_empty_block_offset,
+            default_block_size=self.default_block_size,
+            files=[(elem.name, elem.size, elem.created, elem.modified, elem.offset) for elem in self.files.values()]
+        )
+
+    def restore(self, file, state):
+        """
+        Восстанавливает контейнер из кэша индексов без чтения заголовков и оглавления
+
+        :param file: объект файла контейнера или его отображение в память
+        :type file: BufferedReader | memoryview
+        :param state: состояние, полученное get_state
+        :type state: dict
+        """
+        self.file = file
+        self.offset = state['offset']
+        self.size = state['size']
+        self.first_empty_block_offset = state['first_empty_block_offset']
+        self.default_block_size = state['default_block_size']
+        self.files = collections.OrderedDict()
+        for name, size, created, modified, offset in state['files']:
+            self.files[name] = File(name, size, created, modified, self.read_file_data(file, offset), offset)
+
     def extract(self, dest_dir, deflate=False, recursive=False, *, progress=None):
         """
         Распаковывает содержимое контейнера в каталог
@@ -93,48 +127,92 @@ class Container:
     @staticmethod
     def extract_file(filename, file_obj, path, deflate=False, recursive=False):
         file_path = os.path.join(path, filename)
-        with open(file_path, 'wb') as f:
-            if deflate:
-                # wbits = -15 т.к. у архивированных файлов нет заголовков
-                decompressor = zlib.decompressobj(-15)
-                for chunk in file_obj.data:
-                    decomressed_chunk = decompressor.decompress(chunk)
-                    f.write(decomressed_chunk)
-            else:
-                for chunk in file_obj.data:
-                    f.write(chunk)
-
-        if not recursive:
-            return
+        if deflate:
+            data = Container.decompress_chunks(file_obj.data)
+        else:
+            data = iter(file_obj.data)
 
         # Каждый файл внутри контейнера может быть контейнером
         # Для проверки является ли файл контейнером проверим первые 4 бита
         # Способ проверки ненадежный - нужно придумать что-то другое
-        file_is_container = False
-        with open(file_path, 'rb') as f:
-            if f.read(4) == b'\xFF\xFF\xFF\x7F':
-                file_is_container = True
-        if file_is_container:
-            temp_name = file_path + '.tmp'
-            os.rename(file_path, temp_name)
-            with open(temp_name, 'rb') as f:
-                _container = Container()
-                _container.read(f)
-                _container.extract(file_path, recursive=True)
-            os.remove(temp_name)
+        first_chunk = b''
+        if recursive:
+            for first_chunk in data:
+                if first_chunk:
+                    break
+            if first_chunk[:4] == CONTAINER_SIGNATURE:
+                Container.extract_nested(file_path, first_chunk, data)
+                return
+
+        with open(file_path, 'wb') as f:
+            f.write(first_chunk)
+            for chunk in data:
+                f.write(chunk)
+
+    @staticmethod
+    def extract_nested(path, first_chunk, chunks):
+        """
+        Распаковывает вложенный контейнер. Небольшие контейнеры разбираются в памяти,
+        контейнеры больше NESTED_CONTAINER_MEMORY_LIMIT - через временный файл
+
+        :param path: каталог распаковки
+        :param first_chunk: первый блок данных контейнера
+        :param chunks: итератор остальных блоков данных
+        """
+        buffer = [first_chunk]
+        size = len(first_chunk)
+        for chunk in chunks:
+            buffer.append(chunk)
+            size += len(chunk)
+            if size > NESTED_CONTAINER_MEMORY_LIMIT:
+                with tempfile.TemporaryFile() as f:
+                    f.writelines(buffer)
+                    for _chunk in chunks:
+                        f.write(_chunk)
+                    _container = Container()
+                    _container.read(f)
+                    _container.extract(path, recursive=True)
+                return
+        _container = Container()
+        _container.read(memoryview(b''.join(buffer)))
+        _container.extract(path, recursive=True)
+
+    @staticmethod
+    def decompress_chunks(chunks):
+        # wbits = -15 т.к. у архивированных файлов нет заголовков
+        decompressor = zlib.decompressobj(-15)
+        for chunk in chunks:
+            yield decompressor.decompress(chunk)
+        yield decompressor.flush()
+
+    def read_file_data(self, file, offset):
+        """
+        Считывает данные файла контейнера по смещению из оглавления
+
+        :param file: объект файла контейнера или его отображение в память
+        :type file: BufferedReader | memoryview
+        :param offset: смещение документа с данными файла
+        :type offset: int
+        :return: данные файла, блоки читаются при обходе
+        :rtype: LazyDocument
+        """
+        return LazyDocument(self, file, offset, self.default_block_size)
 
     def read_header(self, file):
         """
         Считывыет заголовок контейнера.
 
-        :param file: объект файла контейнера
-        :type file: BufferedReader
+        :param file: объект файла контейнера или его отображение в память
+        :type file: BufferedReader | memoryview
         :return: Заголовок контейнера
         :rtype: Header
         """
-        file.seek(0 + self.offset)
-        buff = file.read(calcsize(self.header_fmt))
-        header = unpack(self.header_fmt, buff)
+        if isinstance(file, memoryview):
+            header = unpack_from(self.header_fmt, file, self.offset)
+        else:
+            file.seek(0 + self.offset)
+            buff = file.read(calcsize(self.header_fmt))
+            header = unpack(self.header_fmt, buff)
         # if header[0] != self.end_marker:
         #     raise Exception('Bad container format')
         return Header(header[0], header[1], header[2])
@@ -156,8 +234,8 @@ class Container:
         """
         Считывает оглавление контейнера
 
-        :param file: объект файла контейнера
-        :type file: BufferedReader
+        :param file: объект файла контейнера или его отображение в память
+        :type file: BufferedReader | memoryview
         :return: словарь файлов в контейнере
         :rtype: OrderedDict
         """
@@ -182,97 +260,163 @@ class Container:
             name = file_description[3].decode('utf-16').partition('\x00')[0]
 
             doc = Document(self)
-            file_data = doc.read_chunk(file, file_data_offset, self.default_block_size)
+            # генератор нужен только для размеров документа, данные файла читаются заново при обходе
+            doc.read_chunk(file, file_data_offset, self.default_block_size).close()
             self.size += doc.full_size
 
             inner_file = File(name, doc.data_size, self.parse_datetime(file_description[0]),
-                              self.parse_datetime(file_description[1]), file_data)
+                              self.parse_datetime(file_description[1]), self.read_file_data(file, file_data_offset),
+                              file_data_offset)
 
             files[inner_file.name] = inner_file
         return files
 
-    def build(self, file, src_dir, nested=False, *, offset=0):
+    def build(self, file, src_dir, nested=False, *, offset=0, buffer_size=BUFFER_CHUNK_SIZE):
+        """
+        Запаковывает каталог в контейнер. Сначала рассчитывается размещение всех документов,
+        затем контейнер записывается за один последовательный проход без временных файлов.
+
+        :param file: объект файла, в который пишется контейнер
+        :type file: BufferedWriter
+        :param src_dir: каталог с файлами контейнера, подкаталоги запаковываются во вложенные контейнеры
+        :type src_dir: string
+        :param nested: файлы не сжимаются
+        :type nested: bool
+        :param offset: смещение контейнера в файле
+        :type offset: int
+        :param buffer_size: размер буфера копирования файлов (байт)
+        :type buffer_size: int
+        """
         self.offset = offset
         self.file = file
-        files = sorted(os.listdir(src_dir))
-        self.write_header(len(files))
-        for file_name in files:
-            file_path = os.path.join(src_dir, file_name)
-            if os.path.isdir(file_path):
-                with tempfile.TemporaryFile() as tmp2:
-                    _container = Container()
-                    _container.build(tmp2, file_path, nested=True)
-                self.add_file(tmp2, file_name, inflate=not nested)
-            else:
-                with open(file_path, 'rb') as entry_file:
-                    self.add_file(entry_file, file_name, inflate=not nested)
-        self.write_table_off_content()
+        self.calc_layout(src_dir, inflate=not nested, buffer_size=buffer_size)
+        file.seek(offset)
+        self.write_layout(file, buffer_size)
 
-    def write_header(self, count_files=0):
+    def calc_layout(self, src_dir, inflate=False, *, buffer_size=BUFFER_CHUNK_SIZE):
         """
-        Записывает заголовок контейнера
+        Рассчитывает размещение документов контейнера: атрибуты и размеры файлов, смещения блоков, оглавление.
+        При сжатии размер сжатых данных нужен заранее, поэтому файлы и вложенные контейнеры сжимаются
+        вхолостую только для подсчета размера, а write_layout сжимает их повторно сразу в файл назначения.
 
+        :param src_dir: каталог с файлами контейнера
+        :type src_dir: string
+        :param inflate: сжимать файлы, подкаталоги сжимаются целиком как вложенные контейнеры
+        :type inflate: bool
+        :param buffer_size: размер буфера копирования файлов (байт)
+        :type buffer_size: int
+        :return: размер контейнера (байт)
+        :rtype: int
         """
-        self.file.seek(self.offset)
-        self.file.write(
-            pack(self.header_fmt, self.end_marker, self.default_block_size,
-                 count_files, 0))
-        # готовим место для оглавления
-        self.file.write(b'\x00' * (self.index_block_size + self.block_header_size))
-
-    def write_table_off_content(self):
-        if len(self.toc) == 0:
+        files = sorted(os.listdir(src_dir))
+        if not files:
             raise IOError('Container is empty')
-
-        with tempfile.TemporaryFile() as f:
-            for attr_offset, data_offset in self.toc:
-                f.write(pack(f'3{self.index_fmt}', attr_offset, data_offset, self.end_marker))
-
-            doc_size = file_size(f)
-
-            total_blocks = math.ceil(doc_size / self.index_block_size)
-
-            doc = Document(self)
-
-            if total_blocks == 1:
-                doc.write_block(f, doc_size=doc_size, offset=self.header_size)
+        self.src_dir = src_dir
+        self.toc = []
+        self.entries = []
+        # после заголовка контейнера место под первый блок оглавления
+        position = self.header_size + self.block_header_size + self.index_block_size
+        for file_name in files:
+            file_path = os.path.join(src_dir, file_name)
+            if os.path.isdir(file_path):
+                data = Container()
+                data_size = data.calc_layout(file_path)
+                if inflate:
+                    writer = DeflateWriter()
+                    data.write_layout(writer, buffer_size)
+                    data_size = writer.close()
             else:
-                f.seek(0)
-                next_block_offset = file_size(self.file)
-                doc.write_block(io.BytesIO(f.read(self.index_block_size)),
-                                doc_size=doc_size, offset=self.header_size,
-                                min_block_size=self.index_block_size,
-                                next_block_offset=next_block_offset)
-                self.file.seek(0, os.SEEK_END)
-                for i in range(1, total_blocks):
-                    # 31 - длина заголовка блока
-                    next_block_offset += self.index_block_size + self.block_header_size
-                    doc.write_block(io.BytesIO(f.read(self.index_block_size)), doc_size=0,
-                                    next_block_offset=next_block_offset, min_block_size=self.index_block_size)
-                doc.write_block(io.BytesIO(f.read(self.index_block_size)), doc_size=0,
-                                min_block_size=self.index_block_size)
-
-    def add_file(self, fd, name, inflate=False):
+                data = file_path
+                if inflate:
+                    with open(file_path, 'rb') as entry_file:
+                        data_size = Document.compress(entry_file, None, buffer_size)
+                else:
+                    data_size = os.path.getsize(file_path)
+            attributes = Document.get_attributes(file_path, file_name)
+
+            attribute_doc_offset = position
+            position += self.block_header_size + len(attributes)
+            data_doc_offset = position
+            position += self.block_header_size + max(self.default_block_size, data_size)
+
+            self.toc.append((attribute_doc_offset, data_doc_offset))
+            self.entries.append((attributes, data, data_size, inflate))
+
+        toc_size = len(self.toc) * calcsize(f'3{self.index_fmt}')
+        toc_blocks = math.ceil(toc_size / self.index_block_size)
+        if toc_blocks > 1:
+            # оглавление не влезло в первый блок, продолжение пишется в конец контейнера
+            position += toc_blocks * (self.block_header_size + self.index_block_size)
+        self.size = position
+        return self.size
+
+    def write_layout(self, file, buffer_size=BUFFER_CHUNK_SIZE):
         """
-        Добавляет файл в контейнер
+        Записывает рассчитанный calc_layout контейнер в текущую позицию файла
 
-        :param fd: file-like объект файла
-        :type fd: BufferedReader
-        :param name: Имя файла в контейнере
-        :type name: string
-        :param inflate: флаг сжатия
-        :type inflate: bool
+        :param file: объект файла, в который пишется контейнер
+        :type file: BufferedWriter | DeflateWriter
+        :param buffer_size: размер буфера копирования файлов (байт)
+        :type buffer_size: int
         """
-        doc = Document(self)
-        attribute_doc_offset = doc.write_header(fd, name)
-
-        doc = Document(self)
-        if inflate:
-            data_doc_offset = doc.compress(fd, self.file)
+        file.write(pack(self.header_fmt, self.end_marker, self.default_block_size, len(self.toc), 0))
+
+        toc_data = b''.join([pack(f'3{self.index_fmt}', attribute_doc_offset, data_doc_offset, self.end_marker)
+                             for attribute_doc_offset, data_doc_offset in self.toc])
+        toc_size = len(toc_data)
+        toc_blocks = math.ceil(toc_size / self.index_block_size)
+        # как и 1С, первый блок оглавления всегда объявляется размером index_block_size,
+        # по нему читатель вычисляет размер контейнера
+        if toc_blocks == 1:
+            file.write(self.pack_block_header(toc_size, self.index_block_size))
+            file.write(toc_data)
+            file.write(b'\x00' * (self.index_block_size - toc_size))
         else:
-            data_doc_offset = doc.write(fd, min_block_size=self.default_block_size)
-
-        self.toc.append((attribute_doc_offset, data_doc_offset))
+            next_block_offset = self.size - toc_blocks * (self.block_header_size + self.index_block_size)
+            file.write(self.pack_block_header(toc_size, self.index_block_size, next_block_offset))
+            file.write(toc_data[:self.index_block_size])
+
+        for attributes, data, data_size, deflate in self.entries:
+            file.write(self.pack_block_header(len(attributes), len(attributes)))
+            file.write(attributes)
+
+            block_size = max(self.default_block_size, data_size)
+            file.write(self.pack_block_header(data_size, block_size))
+            if isinstance(data, Container):
+                if deflate:
+                    writer = DeflateWriter(file)
+                    data.write_layout(writer, buffer_size)
+                    copied_size = writer.close()
+                else:
+                    data.write_layout(file, buffer_size)
+                    copied_size = data_size
+            else:
+                with open(data, 'rb') as entry_file:
+                    if deflate:
+                        copied_size = Document.compress(entry_file, file, buffer_size)
+                    else:
+                        copied_size = Document.write_block_data(entry_file, file, buffer_size)
+            if copied_size != data_size:
+                source = data.src_dir if isinstance(data, Container) else data
+                raise IOError(f'Файл {source} изменился во время сборки контейнера')
+            file.write(b'\x00' * (block_size - data_size))
+
+        if toc_blocks > 1:
+            # продолжение оглавления: блоки связаны в цепочку, последний блок всегда пустой
+            for i in range(1, toc_blocks + 1):
+                next_block_offset += self.block_header_size + self.index_block_size
+                chunk = toc_data[i * self.index_block_size:(i + 1) * self.index_block_size]
+                file.write(self.pack_block_header(0, self.index_block_size,
+                                                  next_block_offset if i < toc_blocks else None))
+                file.write(chunk)
+                file.write(b'\x00' * (self.index_block_size - len(chunk)))
+
+    def pack_block_header(self, doc_size, block_size, next_block_offset=None):
+        if next_block_offset is None:
+            next_block_offset = self.end_marker
+        header_data = ('\r\n', self.int2hex(doc_size), ' ', self.int2hex(block_size), ' ',
+                       self.int2hex(next_block_offset), ' ', '\r\n')
+        return pack(self.block_header_fmt, *[x.encode() for x in header_data])
 
     @staticmethod
     def int2hex(value):
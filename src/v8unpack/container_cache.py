@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import os
+import pickle
+import threading
+from hashlib import blake2b
+
+from .container import Container, Container64
+
+# Версия формата файлов кэша, при изменении структуры состояния контейнера старые файлы игнорируются
+CACHE_VERSION = 3
+# Размер фрагментов бинарника, по которым считается быстрый хэш
+HASH_SAMPLE_SIZE = 0x10000
+# Ограничение на суммарный размер кэша по умолчанию
+DEFAULT_MAX_SIZE = 0x20000000
+
+CONTAINER_CLASSES = {cls.__name__: cls for cls in (Container, Container64)}
+
+
+class ContainerIndexCache:
+    """
+    Дисковый кэш индексов бинарников: заголовки и оглавления контейнеров
+    и индексы раскрытых вложенных контейнеров. Повторный разбор того же бинарника
+    не перечитывает оглавления.
+
+    Ключ кэша - размер, время изменения и хэш начала, середины и конца файла.
+    Суммарный размер кэша ограничен, при превышении удаляются давно не использованные записи.
+
+    :param cache_dir: папка кэша
+    :type cache_dir: string
+    :param max_size: максимальный суммарный размер файлов кэша (байт)
+    :type max_size: int
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def get_key(self, filename):
+        stat = os.stat(filename)
+        digest = blake2b(f'{CACHE_VERSION}:{stat.st_size}:{stat.st_mtime_ns}'.encode(), digest_size=20)
+        with open(filename, 'rb') as f:
+            for offset in (0, stat.st_size // 2, stat.st_size - HASH_SAMPLE_SIZE):
+                f.seek(max(offset, 0))
+                digest.update(f.read(HASH_SAMPLE_SIZE))
+        return digest.hexdigest()
+
+    def load(self, filename):
+        """
+        Возвращает запись кэша бинарника или None если её нет или она повреждена
+
+        :return: {'containers': [состояния контейнеров], 'nested': {путь: состояние вложенного контейнера}}
+        :rtype: dict
+        """
+        return self.load_entry(self.get_key(filename))
+
+    def save(self, filename, data):
+        self.save_entry(self.get_key(filename), data)
+
+    def load_entry(self, key):
+        """
+        Возвращает запись кэша по ключу или None если её нет или она повреждена.
+        Кроме бинарников по своим ключам здесь хранятся индексы типов выгрузки в формат 1С
+        """
+        path = os.path.join(self.cache_dir, f'{key}.idx')
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # кэш поврежден или записан другой версией - просто строим индекс заново
+            self._remove(path)
+            return None
+        os.utime(path)  # для вытеснения давно не использованных записей
+        return data
+
+    def save_entry(self, key, data):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, f'{key}.idx')
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith('.idx'):
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+        for mtime, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            self._remove(path)
+            total_size -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def dump_containers(containers):
+        return [(container.__class__.__name__, container.get_state()) for container in containers]
+
+    @staticmethod
+    def restore_containers(file, states):
+        containers = []
+        for class_name, state in states:
+            container = CONTAINER_CLASSES[class_name]()
+            container.restore(file, state)
+            containers.append(container)
+        return containers
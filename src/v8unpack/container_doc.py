@@ -1,25 +1,24 @@
 # -*- coding: utf-8 -*-
 import collections
 import datetime
-import io
 import math
+import io
 import os
-import tempfile
+import shutil
 import zlib
 from datetime import datetime, timedelta
 from struct import pack
 # -*- coding: utf-8 -*-
-from struct import unpack
+from struct import unpack, unpack_from
 
-from .helper import file_size
 
 Header = collections.namedtuple('Header', 'first_empty_block_offset, default_block_size, count_files')
 Block = collections.namedtuple('Block', 'doc_size, current_block_size, next_block_offset, data')
 File = collections.namedtuple('File', 'name, size, created, modified, data')
 DocumentData = collections.namedtuple('DocumentData', 'size, data')
 
-# Размер буффера передачи данных из потока в поток
-BUFFER_CHUNK_SIZE = 512
+# Размер буффера передачи данных из потока в поток по умолчанию
+BUFFER_CHUNK_SIZE = 0x100000
 
 
 class Document:
@@ -102,6 +101,8 @@ class Document:
         :return: объект блока данных
         :rtype: Block
         """
+        if isinstance(file, memoryview):
+            return self.read_block_view(file, offset, max_data_length)
         file.seek(offset + self.container.offset)
         header_size = self.container.block_header_size
         buff = file.read(header_size)
@@ -122,68 +123,138 @@ class Document:
 
         return Block(doc_size, current_block_size, next_block_offset, data)
 
-    def write_header(self, file, file_name):
-        modify_time = epoch2int(os.stat(file.fileno()).st_mtime)
-        # В *nix это не время создания файла.
-        creation_time = epoch2int(os.stat(file.fileno()).st_ctime)
-        buffer = b''.join([pack('QQi', creation_time, modify_time, 0), file_name.encode('utf-16-le'), b'\x00' * 4])
-        attribute_doc_offset = self.write(io.BytesIO(buffer))
-        return attribute_doc_offset
+    def read_block_view(self, view, offset, max_data_length=None):
+        """
+        Считывает блок данных из отображенного в память контейнера.
+        Данные блока возвращаются срезом memoryview без копирования.
 
-    def write(self, data, *, min_block_size=0):
-        return self.write_block(data, doc_size=file_size(data), min_block_size=min_block_size)
+        :param view: отображение файла контейнера
+        :type view: memoryview
+        :param offset: смещение блока в файле контейнера (байт)
+        :type offset: int
+        :param max_data_length: максимальный размер считываемых данных из блока (байт)
+        :type max_data_length: int
+        :return: объект блока данных
+        :rtype: Block
+        """
+        position = offset + self.container.offset
+        header_size = self.container.block_header_size
+        if position + header_size > len(view):
+            return
+        header = unpack_from(self.container.block_header_fmt, view, position)
+        doc_size, current_block_size, next_block_offset = int(header[1], 16), int(header[3], 16), int(header[5], 16)
 
-    def write_block(self, data, *, doc_size=0, min_block_size=0, offset=None, next_block_offset=None):
+        if max_data_length is None:
+            max_data_length = min(current_block_size, doc_size)
+
+        data_size = min(current_block_size, max_data_length)
+        position += header_size
+
+        return Block(doc_size, current_block_size, next_block_offset, view[position:position + data_size])
+
+    @staticmethod
+    def get_attributes(path, file_name):
+        """
+        Формирует документ атрибутов файла контейнера: время создания, время изменения и имя файла
+
+        :param path: путь до файла
+        :type path: string
+        :param file_name: имя файла в контейнере
+        :type file_name: string
+        :rtype: bytes
         """
-        Записывает блок данных в контейнер
+        stat = os.stat(path)
+        modify_time = epoch2int(stat.st_mtime)
+        # В *nix это не время создания файла.
+        creation_time = epoch2int(stat.st_ctime)
+        return b''.join([pack('QQi', creation_time, modify_time, 0), file_name.encode('utf-16-le'), b'\x00' * 4])
+
+    @staticmethod
+    def compress(src_fd, dest_fd, buffer_size=BUFFER_CHUNK_SIZE):
+        """
+        Сжимает данные потока сразу в файл назначения, без промежуточного временного файла
 
-        :param data: file-like объект
-        :param kwargs: Опциональные параметры
-        :return: смещение записанных данных (байт)
+        :param src_fd: file-like объект с данными
+        :param dest_fd: file-like объект назначения, None - только подсчитать размер сжатых данных
+        :param buffer_size: размер буфера чтения (байт)
+        :type buffer_size: int
+        :return: размер сжатых данных (байт)
         :rtype: int
         """
-        if offset is not None:
-            self.container.file.seek(offset)
-        else:
-            offset = file_size(self.container.file)
-        block_size = file_size(data)
-        min_block_size = max(min_block_size, block_size)
-        if not next_block_offset:
-            next_block_offset = self.container.end_marker
-
-        header_data = ('\r\n', self.container.int2hex(doc_size), ' ', self.container.int2hex(min_block_size), ' ',
-                       self.container.int2hex(next_block_offset), ' ', '\r\n')
-        header = pack(self.container.block_header_fmt, *[x.encode() for x in header_data])
-
-        self.container.file.write(header)
-        self.write_block_data(data, self.container.file)
-
-        self.container.file.write(b'\x00' * (min_block_size - data.tell()))
-
-        return offset
-
-    @classmethod
-    def compress(cls, src_fd, dest_fd):
-        with tempfile.TemporaryFile() as f:
-            compressor = zlib.compressobj(wbits=-15)
-            src_fd.seek(0)
-            while True:
-                chunk = src_fd.read(BUFFER_CHUNK_SIZE)
-                if not chunk:
-                    f.write(compressor.flush())
-                    break
-                f.write(compressor.compress(chunk))
-            cls.write_block_data(f, dest_fd)
-        # return data_doc_offset
+        src_fd.seek(0)
+        writer = DeflateWriter(dest_fd)
+        shutil.copyfileobj(src_fd, writer, buffer_size)
+        return writer.close()
 
     @staticmethod
-    def write_block_data(data, dest_file):
+    def write_block_data(data, dest_file, buffer_size=BUFFER_CHUNK_SIZE):
+        """
+        Копирует данные в файл назначения. Между обычными файлами копирует ядро (copy_file_range),
+        иначе данные переносятся блоками размером buffer_size
+
+        :return: количество скопированных байт
+        :rtype: int
+        """
         data.seek(0)
+        size = copy_file_range(data, dest_file)
+        if size is not None:
+            return size
+        size = 0
         while True:
-            buffer = data.read(BUFFER_CHUNK_SIZE)
+            buffer = data.read(buffer_size)
             if not buffer:
                 break
             dest_file.write(buffer)
+            size += len(buffer)
+        return size
+
+
+class LazyDocument:
+    """
+    Данные документа контейнера, которые читаются только при обходе. В отличие от начатого генератора
+    не держит срезы отображения файла, пока данные не читаются, поэтому отображение можно закрыть
+    """
+
+    def __init__(self, container, file, offset, min_block_size=0):
+        self.container = container
+        self.file = file
+        self.offset = offset
+        self.min_block_size = min_block_size
+
+    def __iter__(self):
+        return Document(self.container).read_chunk(self.file, self.offset, self.min_block_size)
+
+
+class DeflateWriter:
+    """
+    Файлоподобный объект для записи: сжимает данные (deflate без заголовка) и сразу пишет их в файл назначения.
+    Позволяет сжимать контейнер по мере его записи. Без файла назначения только считает размер сжатых данных.
+    """
+
+    def __init__(self, file=None):
+        self.file = file
+        self.size = 0
+        self._compressor = zlib.compressobj(wbits=-15)
+
+    def write(self, data):
+        self._write(self._compressor.compress(data))
+        return len(data)
+
+    def close(self):
+        """
+        Дописывает остаток сжатых данных
+
+        :return: размер сжатых данных (байт)
+        :rtype: int
+        """
+        self._write(self._compressor.flush())
+        return self.size
+
+    def _write(self, chunk):
+        if chunk:
+            if self.file is not None:
+                self.file.write(chunk)
+            self.size += len(chunk)
 
 
 def epoch2int(epoch_time):
@@ -200,3 +271,42 @@ def epoch2int(epoch_time):
     # Поэтому явно вычисляем разницу между указанной датой и 0001.01.01
     return (datetime.fromtimestamp(epoch_time) - datetime(1, 1, 1)) // timedelta(
         microseconds=100)
+
+
+def copy_file_range(src, dest):
+    """
+    Копирует остаток файла src в текущую позицию файла dest средствами ядра, минуя буферы Python
+
+    :param src: объект файла источника
+    :type src: BufferedReader
+    :param dest: объект файла назначения
+    :type dest: BufferedWriter
+    :return: количество скопированных байт или None, если копирование ядром недоступно
+    :rtype: int
+    """
+    if not hasattr(os, 'copy_file_range'):
+        return None
+    try:
+        src_fd = src.fileno()
+        dest_fd = dest.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        return None
+    dest.flush()
+    src_offset = src.tell()
+    dest_offset = dest.tell()
+    size = os.fstat(src_fd).st_size - src_offset
+    copied = 0
+    try:
+        while copied < size:
+            count = os.copy_file_range(src_fd, dest_fd, size - copied, src_offset + copied, dest_offset + copied)
+            if not count:
+                break
+            copied += count
+    except OSError:
+        # файловая система не поддерживает копирование ядром, копируем через буфер
+        if copied:
+            raise
+        return None
+    src.seek(src_offset + copied)
+    dest.seek(dest_offset + copied)
+    return copied
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+import io
+from contextlib import ExitStack
+
+from .container import Container, CONTAINER_SIGNATURE
+from .container_cache import ContainerIndexCache
+from .container_reader import open_container_file, read_containers
+
+
+class ContainerIndex:
+    """
+    Произвольный доступ к файлам бинарника без полной распаковки.
+
+    Оглавление контейнера считывается один раз, файлы разархивируются только при обращении к ним,
+    вложенные контейнеры раскрываются по пути, например uuid.0/form
+
+    :param filename: полное имя файла-контейнера
+    :type filename: string
+    :param container: номер контейнера в бинарнике, по умолчанию последний, как при разборе
+    :type container: int
+    :param reader: способ чтения контейнера, см. container_reader.extract
+    :type reader: string
+    :param cache_dir: папка кэша индексов, в нем сохраняются и индексы раскрытых вложенных контейнеров
+    :type cache_dir: string
+    """
+
+    def __init__(self, filename, *, container=-1, reader='mmap', cache_dir=None):
+        self.filename = filename
+        self._stack = ExitStack()
+        self._cache = ContainerIndexCache(cache_dir) if cache_dir else None
+        self._cache_data = None
+        self._cache_changed = False
+        try:
+            view = self._stack.enter_context(open_container_file(filename, reader))
+            if self._cache is not None:
+                self._cache_data = self._cache.load(filename)
+            if self._cache_data is None:
+                containers = list(read_containers(view))
+                self._cache_data = dict(containers=ContainerIndexCache.dump_containers(containers), nested={})
+                self._cache_changed = True
+            else:
+                containers = ContainerIndexCache.restore_containers(view, self._cache_data['containers'])
+            root = containers[container]
+        except Exception:
+            self._stack.close()
+            raise
+        self._nested_key = f'{container}:'
+        #: Раскрытые контейнеры: путь -> (контейнер, данные, файлы сжаты)
+        self._containers = {'': (root, view, True)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        try:
+            if self._cache is not None and self._cache_changed:
+                self._cache.save(self.filename, self._cache_data)
+                self._cache_changed = False
+        finally:
+            self._containers = {}
+            self._stack.close()
+
+    def listdir(self, path=''):
+        """
+        Возвращает имена файлов контейнера
+
+        :param path: путь до вложенного контейнера, пустая строка - корневой контейнер
+        :type path: string
+        :rtype: list
+        """
+        container = self._get_container(self._normpath(path))[0]
+        return list(container.files)
+
+    def isdir(self, path):
+        try:
+            self._get_container(self._normpath(path))
+            return True
+        except (FileNotFoundError, NotADirectoryError):
+            return False
+
+    def read(self, name, inflate=True):
+        """
+        Считывает файл контейнера
+
+        :param name: путь до файла, например uuid.0/form
+        :type name: string
+        :param inflate: разархивировать файл корневого контейнера, вложенные контейнеры хранят файлы без сжатия
+        :type inflate: bool
+        :rtype: bytes
+        """
+        parent_path, _, file_name = self._normpath(name).rpartition('/')
+        return self._read_entry(self._get_container(parent_path), file_name, inflate)
+
+    def open(self, name, inflate=True):
+        """
+        Открывает файл контейнера на чтение
+
+        :rtype: BytesIO
+        """
+        return io.BytesIO(self.read(name, inflate))
+
+    def _get_container(self, path):
+        try:
+            return self._containers[path]
+        except KeyError:
+            pass
+        parent_path, _, name = path.rpartition('/')
+        data = self._read_entry(self._get_container(parent_path), name)
+        if data[:4] != CONTAINER_SIGNATURE:
+            raise NotADirectoryError(f'{path} не является контейнером')
+        container = Container()
+        view = memoryview(data)
+        nested = self._cache_data['nested']
+        state = nested.get(f'{self._nested_key}{path}')
+        if state is None:
+            container.read(view)
+            nested[f'{self._nested_key}{path}'] = container.get_state()
+            self._cache_changed = True
+        else:
+            container.restore(view, state)
+        self._containers[path] = (container, view, False)
+        return self._containers[path]
+
+    @staticmethod
+    def _read_entry(parent, name, inflate=True):
+        container, data, compressed = parent
+        try:
+            file_obj = container.files[name]
+        except KeyError:
+            raise FileNotFoundError(name) from None
+        chunks = container.read_file_data(data, file_obj.offset)
+        if compressed and inflate:
+            chunks = container.decompress_chunks(chunks)
+        return b''.join(chunks)
+
+    @staticmethod
+    def _normpath(path):
+        return path.replace('\\', '/').strip('/')
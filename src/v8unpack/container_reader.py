@@ -1,14 +1,24 @@
 # -*- coding: utf-8 -*-
+import mmap
 import os
-import zlib
+from contextlib import contextmanager, ExitStack
 from datetime import datetime
+from functools import partial
 
 from . import helper
-from .container import Container, Container64
+from .container import Container, Container64, CONTAINER_SIGNATURE, File
+from .container_cache import ContainerIndexCache
 from .ext_exception import ExtException
 
+READERS = ('mmap', 'file')
+READ_BUFFER_MIN_SIZE = 0x10000
+READ_BUFFER_MAX_SIZE = 0x400000
 
-def extract(filename, folder, deflate=True, recursive=True):
+# бинарник, открытый процессом пула для распаковки: (имя, способ чтения, размер, время изменения) -> (стек, файл)
+_open_container_files = {}
+
+
+def extract(filename, folder, deflate=True, recursive=True, *, reader='mmap', pool=None, cache_dir=None):
     """
     Распаковка контейнера. Сахар для ContainerReader
 
@@ -20,35 +30,167 @@ def extract(filename, folder, deflate=True, recursive=True):
     :type deflate: boolean
     :param recursive: рекурсивно достаем все контейнеры
     :type recursive: boolean
+    :param reader: способ чтения контейнера: mmap - отображение файла в память, file - последовательное чтение
+    :type reader: string
+    :param pool: пул процессов, если передан файлы контейнера распаковываются параллельно,
+        каждый процесс читает свои файлы напрямую из бинарника
+    :type: pool: Multiprocessing Pool
+    :param cache_dir: папка кэша индексов, если указана оглавления берутся из кэша
+    :type cache_dir: string
     """
     begin = datetime.now()
     print(f'{"Распаковываем бинарник":30}:', end="")
     helper.clear_dir(folder)
+    if reader not in READERS:
+        raise ExtException(message='Неподдерживаемый способ чтения контейнера', detail=f'reader={reader}')
+    tasks = []
+    with open_container_file(filename, reader) as f:
+        for container_index, container in enumerate(load_containers(f, filename, cache_dir)):
+            dest_dir = os.path.join(folder, str(container_index))
+            if pool is None:
+                container.extract(dest_dir, deflate, recursive, progress=container_index)
+            else:
+                helper.clear_dir(dest_dir)
+                for file_obj in container.files.values():
+                    tasks.append((filename, reader, container.__class__, container.offset,
+                                  container.default_block_size, file_obj.name, file_obj.offset, dest_dir, deflate,
+                                  recursive, file_obj.size))
+
+    if tasks:
+        helper.run_in_pool(extract_file, tasks, pool=pool, title=f'{"Распаковываем контейнеры":30}')
+    print(f"{datetime.now() - begin}")
+
+
+def read_containers(f):
+    """
+    Последовательно считывает оглавления всех контейнеров бинарника
+
+    :param f: объект файла бинарника или его отображение в память
+    :type f: BufferedReader | memoryview
+    :return: генератор контейнеров
+    """
+    offset = 0
+    while True:
+        try:
+            container = detect_format(f, offset)
+            container.read(f, offset)
+        except EOFError:
+            return
+        yield container
+        offset += container.size
+        if offset == 0:
+            raise NotImplementedError()
+
+
+def load_containers(f, filename, cache_dir=None):
+    """
+    Считывает оглавления всех контейнеров бинарника, если задана папка кэша - берет их из кэша индексов
+
+    :param f: объект файла бинарника или его отображение в память
+    :type f: BufferedReader | memoryview
+    :param filename: полное имя файла бинарника
+    :type filename: string
+    :param cache_dir: папка кэша индексов
+    :type cache_dir: string
+    :rtype: list
+    """
+    if cache_dir is None:
+        return list(read_containers(f))
+    cache = ContainerIndexCache(cache_dir)
+    data = cache.load(filename)
+    if data is not None:
+        return cache.restore_containers(f, data['containers'])
+    containers = list(read_containers(f))
+    cache.save(filename, dict(containers=cache.dump_containers(containers), nested={}))
+    return containers
+
+
+@helper.task_cost(lambda params: params[10])
+def extract_file(params):
+    """
+    Распаковывает один файл контейнера, читая его данные из бинарника по смещению из оглавления.
+    Выполняется в процессе пула: бинарник открывается процессом один раз на все его задания (get_container_file).
+    Стоимость задания - размер данных файла по оглавлению.
+    """
+    filename, reader, container_class, offset, default_block_size, name, data_offset, dest_dir, deflate, \
+        recursive, size = params
+    try:
+        f = get_container_file(filename, reader)
+        container = container_class()
+        container.offset = offset
+        container.default_block_size = default_block_size
+        file_obj = File(name, None, None, None, container.read_file_data(f, data_offset))
+        container.extract_file(name, file_obj, dest_dir, deflate, recursive)
+    except Exception as err:
+        raise ExtException(
+            parent=err, message="Ошибка при разархифировании контейнера",
+            detail=f'{name} ({err})')
+
+
+def get_container_file(filename, reader='mmap'):
+    """
+    Возвращает открытый процессом бинарник, см. open_container_file. Бинарник остается открытым для следующих
+    заданий процесса и закрывается при обращении к другому или изменившемуся бинарнику
+    или close_container_files.
+    """
+    stat = os.stat(filename)
+    key = filename, reader, stat.st_size, stat.st_mtime_ns
+    entry = _open_container_files.get(key)
+    if entry is None:
+        close_container_files()
+        stack = ExitStack()
+        entry = stack, stack.enter_context(open_container_file(filename, reader))
+        _open_container_files[key] = entry
+    return entry[1]
+
+
+def close_container_files():
+    """
+    Закрывает бинарники, открытые get_container_file
+    """
+    while _open_container_files:
+        stack, f = _open_container_files.popitem()[1]
+        stack.close()
+
+
+@contextmanager
+def open_container_file(filename, reader='mmap'):
+    """
+    Открывает файл контейнера на чтение
+
+    :return: отображение файла в память для reader = mmap или объект файла
+    :rtype: memoryview | BufferedReader
+    """
     with open(filename, 'rb') as f:
-        offset = 0
-        container_index = 0
-        while True:
+        if reader != 'mmap' or not os.fstat(f.fileno()).st_size:
+            yield f
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        try:
+            yield view
+        except BaseException:
+            view.release()
             try:
-                container = detect_format(f, offset)
-                container.read(f, offset)
-                container.extract(os.path.join(folder, str(container_index)), deflate, recursive,
-                                  progress=container_index)
-                container_index += 1
-                offset += container.size
-                if offset == 0:
-                    raise NotImplementedError()
-            except EOFError:
-                return
-            except Exception as err:
-                raise err from err
-
-    print(f"{datetime.now() - begin}")
+                mapped.close()
+            except BufferError:
+                # срезы отображения держит трассировка исключения, отображение закроет сборщик мусора,
+                # а наружу уходит исходная ошибка
+                pass
+            raise
+        # срезы отображения не должны переживать работу с файлом: иначе файл остается открытым
+        # (в Windows - заблокированным) до сборки мусора
+        view.release()
+        mapped.close()
 
 
 def detect_format(f, offset):
-    f.seek(offset)
-    first = f.read(8)
-    if first[0:4] == b'\xFF\xFF\xFF\x7F':
+    if isinstance(f, memoryview):
+        first = f[offset:offset + 8].tobytes()
+    else:
+        f.seek(offset)
+        first = f.read(8)
+    if first[0:4] == CONTAINER_SIGNATURE:
         return Container()
     elif first == b'':
         raise EOFError()
@@ -74,44 +216,25 @@ def decompress_and_extract(src_folder, dest_folder, *, pool=None):
     helper.run_in_pool(decompress_file_and_extract, tasks, pool=pool, title=f'{"Распаковываем контейнеры":30}')
 
 
+@helper.task_cost(lambda params: helper.get_path_size(os.path.join(params[0], params[1])))
 def decompress_file_and_extract(params):
     src_folder, filename, dest_folder = params
     src_path = os.path.join(src_folder, filename)
-    dest_path = os.path.join(dest_folder, filename)
-    file_is_container = None
-
-    # wbits = -15 т.к. у архивированных файлов нет заголовков
-    decompressor = zlib.decompressobj(-15)
     try:
-        with open(dest_path, 'wb') as dest:
-            with open(src_path, 'rb') as src:
-                while True:
-                    buf = decompressor.unconsumed_tail
-                    if buf == b'':
-                        buf = src.read(8192)
-                        if buf == b'':
-                            break
-                    data = decompressor.decompress(buf)
-                    if file_is_container is None:
-                        file_is_container = data[0:4] == b'\xFF\xFF\xFF\x7F'
-                    if data == b'':
-                        break
-                    dest.write(data)
-
-        # Каждый файл внутри контейнера может быть контейнером
-        # Для проверки является ли файл контейнером проверим первые 4 бита
-        # Способ проверки ненадежный - нужно придумать что-то другое
-
-        if file_is_container:
-            temp_filename = dest_path + ".temp"
-            os.rename(dest_path, temp_filename)
-            with open(temp_filename, 'rb') as f:
-                container = Container()
-                container.read(f)
-                container.extract(dest_path, recursive=True)
-            os.remove(temp_filename)
-
+        with open(src_path, 'rb') as src:
+            buffer_size = get_read_buffer_size(os.fstat(src.fileno()).st_size)
+            file_obj = File(filename, None, None, None, iter(partial(src.read, buffer_size), b''))
+            # вложенные контейнеры разбираются в памяти, без переименования во временный файл
+            Container.extract_file(filename, file_obj, dest_folder, deflate=True, recursive=True)
     except Exception as err:
         raise ExtException(
             parent=err, message="Ошибка при разархифировании контейнера",
             detail=f'{filename} ({err})')
+
+
+def get_read_buffer_size(size):
+    """
+    Размер буфера чтения сжатого файла: небольшие файлы читаются целиком за одно обращение,
+    большие - блоками не больше READ_BUFFER_MAX_SIZE
+    """
+    return min(max(size, READ_BUFFER_MIN_SIZE), READ_BUFFER_MAX_SIZE)
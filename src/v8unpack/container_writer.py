@@ -1,20 +1,19 @@
 # -*- coding: utf-8 -*-
 import datetime
 import os
-import tempfile
+import shutil
 from base64 import b64encode
 from datetime import datetime
 from hashlib import sha1
 
-from tqdm.auto import tqdm
-
 from . import helper
 from .container import Container, Container64
-from .container_doc import Document
+from .container_doc import Document, DeflateWriter, BUFFER_CHUNK_SIZE
+from .ext_exception import ExtException
 from .json_container_decoder import JsonContainerDecoder
 
 
-def build(src_dir, filename, nested=False):
+def build(src_dir, filename, nested=False, *, buffer_size=BUFFER_CHUNK_SIZE):
     """
     Запаковывает каталог в контейнер включая вложенные каталоги.
     Сахар для ContainerWriter.
@@ -25,8 +24,8 @@ def build(src_dir, filename, nested=False):
     :type filename: string
     :param nested:
     :type nested: bool
-    :param version: версия под которую собирается продукт
-    :type version: string
+    :param buffer_size: размер буфера копирования файлов (байт)
+    :type buffer_size: int
     """
     begin = datetime.now()
     print(f'{"Запаковываем бинарник":30}:', end="")
@@ -41,11 +40,11 @@ def build(src_dir, filename, nested=False):
     with open(filename, 'w+b') as f:
         _src_dir = os.path.join(src_dir, '0')
         container = Container()
-        container.build(f, _src_dir, nested, offset=0)
+        container.build(f, _src_dir, nested, offset=0, buffer_size=buffer_size)
         if containers_count == 2:
             _src_dir = os.path.join(src_dir, '1')
             container = Container64()
-            container.build(f, _src_dir, nested, offset=f.seek(0, os.SEEK_END))
+            container.build(f, _src_dir, nested, offset=f.seek(0, os.SEEK_END), buffer_size=buffer_size)
     print(f" - {datetime.now() - begin}")
 
 
@@ -81,34 +80,67 @@ def calc_sha1(src_folder, dest_folder):
     pass
 
 
-def compress_and_build_simple_file(src_path, dest_path):
+def compress_and_build_simple_file(src_path, dest_path, buffer_size=BUFFER_CHUNK_SIZE):
     with open(dest_path, 'w+b') as dest_fd:
         with open(src_path, 'rb') as src_fd:
-            Document.compress(src_fd, dest_fd)
+            Document.compress(src_fd, dest_fd, buffer_size)
 
 
-def compress_and_build(src_dir, dest_dir, *, pool=None, nested=False):
-    containers = os.listdir(src_dir)
+def compress_and_build(src_dir, dest_dir, *, pool=None, buffer_size=BUFFER_CHUNK_SIZE, compressed=None):
+    """
+    Сжимает файлы и вложенные каталоги исходников контейнеров.
+    Файлы сжимаются параллельно в пуле процессов, каждый процесс потоково пишет свой файл назначения.
+    Контрольные суммы считаются после сжатия всех файлов в порядке их имен.
+
+    :param src_dir: каталог с исходниками контейнеров
+    :type src_dir: string
+    :param dest_dir: каталог назначения
+    :type dest_dir: string
+    :param pool: пул процессов
+    :type: pool: Multiprocessing Pool
+    :param buffer_size: размер буфера чтения файлов (байт)
+    :type buffer_size: int
+    :param compressed: уже сжатые файлы из кэша сборки {полный путь исходника: путь сжатого файла},
+        они копируются без сжатия
+    :type compressed: dict
+    """
+    containers = sorted(os.listdir(src_dir))
     helper.clear_dir(dest_dir)
+    tasks = []
     for dir_name in containers:
         _src_dir = os.path.join(src_dir, dir_name)
         _dest_dir = os.path.join(dest_dir, dir_name)
         helper.clear_dir(_dest_dir)
 
         entries = sorted(os.listdir(_src_dir))
+        for filename in entries:
+            compressed_path = compressed.get(os.path.abspath(os.path.join(_src_dir, filename))) if compressed else None
+            tasks.append((_src_dir, filename, _dest_dir, buffer_size, compressed_path))
 
-        with tqdm(desc=f'{"Архивируем контейнеры":30}', total=len(entries)) as pbar:
-            for filename in entries:
-                src_path = os.path.join(_src_dir, filename)
-                dest_path = os.path.join(_dest_dir, filename)
-                # add_entry(container, src_dir, filename)
-                if os.path.isdir(src_path):
-                    with open(dest_path, 'w+b') as dest_fd:
-                        with tempfile.TemporaryFile() as tmp:
-                            container = Container()
-                            container.build(tmp, src_path, nested=True)
-                            Document.compress(tmp, dest_fd)
-                else:
-                    compress_and_build_simple_file(src_path, dest_path)
-                pbar.update()
-            calc_sha1(_src_dir, _dest_dir)
+    helper.run_in_pool(compress_and_build_file, tasks, pool=pool, title=f'{"Архивируем контейнеры":30}')
+
+    for dir_name in containers:
+        calc_sha1(os.path.join(src_dir, dir_name), os.path.join(dest_dir, dir_name))
+
+
+def compress_and_build_file(params):
+    src_dir, filename, dest_dir, buffer_size, compressed_path = params
+    src_path = os.path.join(src_dir, filename)
+    dest_path = os.path.join(dest_dir, filename)
+    try:
+        if compressed_path is not None:
+            shutil.copyfile(compressed_path, dest_path)
+        elif os.path.isdir(src_path):
+            # размещение вложенного контейнера известно заранее, поэтому он сжимается по мере записи
+            container = Container()
+            container.calc_layout(src_path)
+            with open(dest_path, 'wb') as dest_fd:
+                writer = DeflateWriter(dest_fd)
+                container.write_layout(writer, buffer_size)
+                writer.close()
+        else:
+            compress_and_build_simple_file(src_path, dest_path, buffer_size)
+    except Exception as err:
+        raise ExtException(
+            parent=err, message="Ошибка при архивировании контейнера",
+            detail=f'{filename} ({err})')
@@ -3,10 +3,12 @@ import shutil
 from datetime import datetime
 
 from . import helper
+from .build_cache import BuildCache
 from .MetaObject.Configuration import Configuration
 from .MetaObject.ConfigurationExtension import ConfigurationExtension
 from .MetaObject.ExternalDataProcessor import ExternalDataProcessor
 from .ext_exception import ExtException
+from .manifest import DecodeManifest
 from .metadata_types import MetaDataTypes
 
 available_types = {
@@ -75,19 +77,42 @@ class Decoder:
         )
 
     @classmethod
-    def decode(cls, src_dir, dest_dir, *, pool=None, options=None):
+    def decode(cls, src_dir, dest_dir, *, pool=None, options=None, manifest=None):
         begin = datetime.now()
         print(f'{"Разбираем объект":30}')
         decoder = cls.detect_version(src_dir, options=options)
+        if manifest is not None:
+            cls.decode_incremental(decoder, src_dir, dest_dir, manifest, pool=pool, options=options)
+            print(f'{"Разбор объекта закончен":30}: {datetime.now() - begin}')
+            return
         helper.clear_dir(dest_dir)
         tasks = decoder.decode(src_dir, dest_dir)  # возвращает список вложенных объектов MetaDataObject
-        while tasks:  # многопоточно рекурсивно декодируем вложенные объекты MetaDataObject
-            tasks = helper.run_in_pool(cls.decode_include, tasks, pool, title=f'{"Разбираем вложенные объекты":30}',
-                                       need_result=True)
-            # tasks = helper.list_merge(*tasks_list)
+        # многопоточно рекурсивно декодируем вложенные объекты MetaDataObject,
+        # вложенные объекты уходят в пул сразу после разбора родителя
+        helper.run_in_pool_tree(cls.decode_include, tasks, pool, title=f'{"Разбираем вложенные объекты":30}')
         print(f'{"Разбор объекта закончен":30}: {datetime.now() - begin}')
 
     @classmethod
+    def decode_incremental(cls, decoder, src_dir, dest_dir, manifest_path, *, pool=None, options=None):
+        """
+        Разбирает только вложенные объекты, файлы которых изменились с прошлого разбора в ту же папку,
+        файлы удаленных объектов удаляются. Без манифеста прошлого разбора разбирает все и создает манифест.
+
+        :param manifest_path: путь до файла манифеста
+        :type manifest_path: string
+        """
+        manifest = DecodeManifest(manifest_path, src_dir, dest_dir, options=options, pool=pool)
+        if not manifest.load():
+            helper.clear_dir(dest_dir)
+        manifest.remove_root_outputs()
+        tasks = manifest.update('', decoder.decode(src_dir, dest_dir) or [])
+        helper.run_in_pool_tree(cls.decode_include, tasks, pool, title=f'{"Разбираем вложенные объекты":30}',
+                                get_child_tasks=lambda task, res: manifest.update(manifest.get_key(task), res or []))
+        manifest.save()
+        print(f'{"Разобрано объектов":30}: {len(manifest.changed) - 1} из {len(manifest.entries) - 1}')
+
+    @classmethod
+    @helper.task_cost(lambda params: get_decode_include_cost(params))
     def decode_include(cls, params):
         include_type, (obj_uuid, src_dir, dest_dir, new_dest_path, parent_container_uuid, options) = params
         try:
@@ -106,7 +131,7 @@ class Decoder:
             raise ExtException(parent=err, action=f'{cls.__name__}.decode_include')
 
     @classmethod
-    def encode(cls, src_dir, dest_dir, *, pool=None, file_name=None, options=None):
+    def encode(cls, src_dir, dest_dir, *, pool=None, file_name=None, options=None, build_cache=None):
         begin = datetime.now()
         print(f'{"Собираем объект":30}')
         helper.clear_dir(dest_dir)
@@ -123,32 +148,66 @@ class Decoder:
         child_tasks = encoder.encode_includes(src_dir, file_name, dest_dir, parent_id)
         include_index = {}
         file_list = []
-        object_task = []
-        title = f'{"Собираем вложенные объекты":30}'
-        while object_task or child_tasks:  # многопоточно рекурсивно декодируем вложенные объекты MetaDataObject
-            _file_list, _include_index, _object_task, child_tasks = helper.run_in_pool_encode_include(
-                cls.encode_include, child_tasks, pool,
-                title=title
-            )
-            if _file_list:
-                file_list.extend(_file_list)
-            if _include_index:
-                helper.update_dict(include_index, _include_index)
-            if _object_task:
-                object_task.append(_object_task)
-            if not child_tasks and object_task:
-                _object_task = object_task.pop()
-                for elem in _object_task:
-                    elem[1][6] = include_index.pop(f"{elem[1][4]}/{elem[0]}/{elem[1][1]}")
-                child_tasks = _object_task
-                title = f'{"Собираем вложенные объекты":30}'
-            a = 1
+        objects = []
+        # родители, которые ждут сборки вложенных объектов: ключ - parent_id/тип/имя,
+        # значение - задание сборки родителя и количество еще не собранных вложенных объектов
+        waiting = {}
+
+        def get_child_tasks(task, result):
+            include_type, params = task
+            _object_task, _child_tasks = result
+            if isinstance(_object_task, list):
+                waiting[f'{params[4]}/{include_type}/{params[1]}'] = [_object_task, len(_child_tasks)]
+                return _child_tasks
+            if isinstance(_object_task, dict):
+                cls.add_encoded_object(_object_task, include_index, file_list)
+                objects.append(_object_task)
+            elif _object_task is not None:
+                raise NotImplementedError()
+            _child_tasks = list(_child_tasks or [])
+
+            # объект собран, родитель собирается сразу после сборки последнего вложенного объекта
+            parent = waiting.get(params[4])
+            if parent is not None:
+                parent[1] -= 1
+                if not parent[1]:
+                    del waiting[params[4]]
+                    parent_task = parent[0]
+                    parent_task[1][6] = include_index.pop(params[4])
+                    _child_tasks.append(parent_task)
+            return _child_tasks
+
+        # многопоточно рекурсивно собираем вложенные объекты MetaDataObject
+        try:
+            helper.run_in_pool_tree(cls.encode_include, child_tasks, pool, title=f'{"Собираем вложенные объекты":30}',
+                                    get_child_tasks=get_child_tasks)
+        except BaseException:
+            # задания дерева к этому моменту завершены, недособранный контейнер не должен попасть в сжатие и кэш
+            helper.clear_dir(dest_dir)
+            raise
+        if build_cache is not None:
+            build_cache.add_objects(objects, dest_dir)
 
         encoder.encode(src_dir, dest_dir, file_name=file_name, include_index=include_index.pop(parent_id, None),
                        file_list=file_list)
 
         print(f'{"Сборка объекта закончена":30}: {datetime.now() - begin}')
 
+    @staticmethod
+    def add_encoded_object(obj, include_index, file_list):
+        """
+        Добавляет собранный вложенный объект в индекс для заголовка родителя
+
+        :param obj: результат сборки объекта (Decoder.encode_include)
+        :param include_index: индекс вложенных объектов {parent_id: {тип: [(uuid, имя, данные)]}}
+        :param file_list: список файлов контейнера
+        """
+        if obj['file_list']:
+            file_list.extend(obj['file_list'])
+        if obj['obj_data']:
+            include_index.setdefault(obj['parent_id'], {}).setdefault(obj['obj_type'], []).append(
+                (obj['obj_uuid'], obj['obj_name'], obj['obj_data']))
+
     @classmethod
     def get_encoder(cls, src_dir, options=None):
         _type = None
@@ -161,18 +220,38 @@ class Decoder:
     def encode_include(cls, params):
         include_type, (new_src_dir, entry, dest_dir, options, parent_id, parent_container_uuid, include_index) = params
         try:
+            build_cache = BuildCache.from_options(options)
+            cache_key = None
+            if build_cache is not None:
+                cache_key = build_cache.get_key(params)
+                if not include_index:  # объект вместе с вложенными объектами не менялся
+                    object_task = build_cache.restore(cache_key, dest_dir)
+                    if object_task is not None:
+                        return object_task, None
             handler = helper.get_class_metadata_object(include_type)
 
             # handler = handler.get_version(options.get('version', '803')[:3])(options=options)
             # handler.title = include_type
             object_task, child_tasks = handler.encode(new_src_dir, entry, dest_dir, parent_id, parent_container_uuid,
                                                       include_index, options=options)
+            if cache_key is not None and isinstance(object_task, dict):
+                object_task['cache_key'] = cache_key
+                object_task['obj_id'] = f'{parent_id}/{include_type}/{entry}'
             return object_task, child_tasks
         except Exception as err:
             raise ExtException(parent=err, action=f'Decoder.encode_include({include_type})') from None
 
 
-def encode(src_dir, dest_dir, *, pool=None, options=None, file_name=None):
+def get_decode_include_cost(params):
+    """
+    Стоимость разбора вложенного объекта - размер его файлов в контейнере: заголовка и данных (.0)
+    """
+    include_type, (obj_uuid, src_dir, dest_dir, new_dest_path, parent_container_uuid, options) = params
+    return helper.get_path_size(os.path.join(src_dir, obj_uuid)) + \
+        helper.get_path_size(os.path.join(src_dir, f'{obj_uuid}.0'))
+
+
+def encode(src_dir, dest_dir, *, pool=None, options=None, file_name=None, build_cache=None):
     def unpack_dummy():
         helper.clear_dir(dest_dir)
         dummy_path = os.path.join(src_dir, 'dummy.zip')
@@ -191,16 +270,19 @@ def encode(src_dir, dest_dir, *, pool=None, options=None, file_name=None):
     container_dest_dir = os.path.join(dest_dir, '0')
     container_dest_dir = unpack_dummy()
     # options = helper.set_options_param(options, 'version', version[:3])
-    Decoder.encode(src_dir, container_dest_dir, pool=pool, options=options, file_name=file_name)
+    Decoder.encode(src_dir, container_dest_dir, pool=pool, options=options, file_name=file_name,
+                   build_cache=build_cache)
 
 
-def decode(src_dir, dest_dir, *, pool=None, options=None):
+def decode(src_dir, dest_dir, *, pool=None, options=None, manifest=None):
     containers = os.listdir(src_dir)
     containers_count = len(containers)
     if containers_count not in [1, 2]:
         raise NotImplementedError(f'Количество контейнеров {containers_count}')
 
     _src_dir = os.path.join(src_dir, containers[-1])
-    Decoder.decode(_src_dir, dest_dir, pool=pool, options=options)
+    Decoder.decode(_src_dir, dest_dir, pool=pool, options=options, manifest=manifest)
     if containers_count == 2:
         shutil.make_archive(os.path.join(dest_dir, 'dummy'), 'zip', os.path.join(src_dir, '0'))
+    elif manifest is not None and os.path.isfile(os.path.join(dest_dir, 'dummy.zip')):
+        os.remove(os.path.join(dest_dir, 'dummy.zip'))  # остался от прошлого разбора
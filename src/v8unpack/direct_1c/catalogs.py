@@ -7,6 +7,7 @@ from ..format_1c.catalogs import build_catalog_xml, catalog_generated_types
 from ..format_1c.catalog_attributes import parse_catalog_attributes
 from ..format_1c.catalog_commands import find_command_ext_uuid
 from ..format_1c.common import last_uuid_in_meta_header, is_zero_uuid
+from ..format_1c.types import new_type_maps
 from .types import build_type_maps_from_root
 from .forms import export_catalog_form
 
@@ -35,11 +36,7 @@ def export_catalog(src_dir: str, obj_file: str, dest_dir: str, *, options=None,
     has_predefined = os.path.isfile(os.path.join(src_dir, f'{uuid}.1c'))
 
     if type_maps is None:
-        type_maps = build_type_maps_from_root(src_dir, root_header) if root_header else {
-            'catalog_ref': {},
-            'document_ref': {},
-            'defined_type': {},
-        }
+        type_maps = build_type_maps_from_root(src_dir, root_header) if root_header else new_type_maps()
     header_dict = {'header': header_data}
     attributes = parse_catalog_attributes(header_dict, type_maps)
 
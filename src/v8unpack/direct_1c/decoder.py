@@ -23,15 +23,24 @@ def extract_1c_direct(src_dir: str, dest_dir: str, *, options=None, pool=None):
 
     _src_dir = _detect_container_root(src_dir)
     header_data = _read_root_header(_src_dir)
-    type_maps = build_type_maps_from_root(_src_dir, header_data)
+    type_maps = build_type_maps_from_root(_src_dir, header_data, cache_dir=options.get('cache'))
+    tasks = []
     for obj_type, obj_file in _iter_root_includes(header_data):
-        handler = SUPPORTED_TYPES.get(obj_type)
-        if not handler:
+        if obj_type not in SUPPORTED_TYPES:
             continue
-        if obj_type == 'Catalog':
-            handler(_src_dir, obj_file, dest_dir, options=options, root_header=header_data, type_maps=type_maps)
-        else:
-            handler(_src_dir, obj_file, dest_dir, options=options)
+        # type maps are built once here and shipped only with the tasks that need them
+        tasks.append((obj_type, _src_dir, obj_file, dest_dir, options, type_maps if obj_type == 'Catalog' else None))
+    helper.run_in_pool(_export_object, tasks, pool=pool, title=f'{"Выгружаем объекты в формат 1С":30}')
+
+
+def _export_object(params):
+    """Pool task: export one root object, every object is written to its own files."""
+    obj_type, src_dir, obj_file, dest_dir, options, type_maps = params
+    handler = SUPPORTED_TYPES[obj_type]
+    if obj_type == 'Catalog':
+        handler(src_dir, obj_file, dest_dir, options=options, type_maps=type_maps)
+    else:
+        handler(src_dir, obj_file, dest_dir, options=options)
 
 
 def _read_root_header(src_dir: str):
@@ -1,8 +1,11 @@
-﻿from .. import helper
+﻿import os
+
+from .. import helper
 from ..metadata_types import MetaDataTypes
 from ..MetaDataObject.Catalog import Catalog
 from ..MetaDataObject.Document import Document
 from ..MetaDataObject.DefinedType import DefinedType
+from ..format_1c.types import new_type_maps, add_type, cached_type_maps
 
 
 def _decode_header(header_data, *, options=None):
@@ -18,62 +21,40 @@ def _decode_header(header_data, *, options=None):
     return dummy.header
 
 
-def build_type_maps_from_root(src_dir: str, root_header):
-    catalog_ref = {}
-    document_ref = {}
-    defined_type = {}
-
+def build_type_maps_from_root(src_dir: str, root_header, cache_dir=None):
     class_map = {
         'Catalog': Catalog,
         'Document': Document,
         'DefinedType': DefinedType,
     }
-
-    for obj_type, obj_file in _iter_root_objects(root_header):
-        if obj_type not in ('Catalog', 'Document', 'DefinedType'):
-            continue
-        try:
-            header_data = helper.brace_file_read(src_dir, obj_file)
-        except Exception:
-            continue
-
-        try:
-            meta_cls = class_map[obj_type]
-            obj_header = _decode_header(meta_cls.get_decode_header(header_data))
-        except Exception:
-            continue
-
-        name = obj_header.get('name', '')
-        try:
-            arr = header_data[0][1]
-        except Exception:
-            continue
-
-        if obj_type == 'Catalog':
-            type_id = _safe_get(arr, 3)
-            if type_id:
-                catalog_ref[type_id] = name
-        elif obj_type == 'Document':
-            type_id = _safe_get(arr, 3)
-            if type_id:
-                document_ref[type_id] = name
-        elif obj_type == 'DefinedType':
-            type_id = _safe_get(arr, 1)
-            if type_id:
-                defined_type[type_id] = name
-
-    return {
-        'catalog_ref': catalog_ref,
-        'document_ref': document_ref,
-        'defined_type': defined_type,
-    }
-
-
-def _safe_get(arr, index):
-    try:
-        return arr[index]
-    except Exception:
-        return None
+    sources = [
+        (obj_type, obj_file) for obj_type, obj_file in _iter_root_objects(root_header) if obj_type in class_map
+    ]
+
+    def build():
+        type_maps = new_type_maps()
+        for obj_type, obj_file in sources:
+            try:
+                header_data = helper.brace_file_read(src_dir, obj_file)
+            except Exception:
+                continue
+
+            try:
+                meta_cls = class_map[obj_type]
+                obj_header = _decode_header(meta_cls.get_decode_header(header_data))
+            except Exception:
+                continue
+
+            try:
+                arr = header_data[0][1]
+            except Exception:
+                continue
+            add_type(type_maps, obj_type, arr, obj_header.get('name', ''))
+        return type_maps
+
+    return cached_type_maps(cache_dir, [
+        (f'{obj_type}/{obj_file}', os.path.join(src_dir, obj_file)) for obj_type, obj_file in sources
+    ], build)
 
 
 def _iter_root_objects(header_data):
@@ -6,10 +6,10 @@ from .common_modules import export_common_modules
 from .catalogs import export_catalogs
 
 
-def export_1c_format(src_dir: str, dest_dir: str):
+def export_1c_format(src_dir: str, dest_dir: str, *, cache_dir=None):
     try:
         helper.clear_dir(dest_dir)
         export_common_modules(src_dir, dest_dir)
-        export_catalogs(src_dir, dest_dir)
+        export_catalogs(src_dir, dest_dir, cache_dir=cache_dir)
     except Exception as err:
         raise ExtException(parent=err, message='?????? ???????? ? ?????? 1?')
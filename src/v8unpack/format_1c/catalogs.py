@@ -8,14 +8,14 @@ from .catalog_attributes import parse_catalog_attributes, render_catalog_attribu
 from .catalog_commands import parse_catalog_commands, render_catalog_command
 
 
-def export_catalogs(src_dir: str, dest_dir: str):
+def export_catalogs(src_dir: str, dest_dir: str, *, cache_dir=None):
     src_root = os.path.join(src_dir, 'Catalog')
     if not os.path.isdir(src_root):
         return
 
     dest_root = os.path.join(dest_dir, 'Catalogs')
     helper.makedirs(dest_root, exist_ok=True)
-    type_maps = build_type_maps(src_dir)
+    type_maps = build_type_maps(src_dir, cache_dir=cache_dir)
 
     for obj_name in os.listdir(src_root):
         obj_dir = os.path.join(src_root, obj_name)
@@ -1,51 +1,87 @@
 import os
+from hashlib import blake2b
 
 from .. import helper
+from ..container_cache import ContainerIndexCache
 from .common import unquote
 
 
-def build_type_maps(src_dir: str):
-    def scan_ref_types(parent_dir: str, file_name: str, type_index: int):
-        mapping = {}
-        if not os.path.isdir(parent_dir):
-            return mapping
-        for obj_name in os.listdir(parent_dir):
-            obj_dir = os.path.join(parent_dir, obj_name)
-            if not os.path.isdir(obj_dir):
-                continue
-            try:
-                header = helper.json_read(obj_dir, file_name)
-                arr = header['header'][0][1]
-                type_id = arr[type_index]
-                name = header.get('name', obj_name)
-                mapping[type_id] = name
-            except Exception:
-                continue
-        return mapping
+# objects resolved by the type index: map name and position of the type uuid in header[0][1]
+TYPE_MAP_SOURCES = {
+    'Catalog': ('catalog_ref', 3),
+    'Document': ('document_ref', 3),
+    'DefinedType': ('defined_type', 1),
+}
+# bump when the layout of the index changes, old cache entries are ignored
+TYPE_MAPS_VERSION = 1
+
+
+def new_type_maps():
+    return {map_name: {} for map_name, type_index in TYPE_MAP_SOURCES.values()}
+
 
-    def scan_defined_types(parent_dir: str):
-        mapping = {}
+def add_type(type_maps: dict, obj_type: str, arr: list, name: str):
+    map_name, type_index = TYPE_MAP_SOURCES[obj_type]
+    try:
+        type_id = arr[type_index]
+    except Exception:
+        return
+    if type_id:
+        type_maps[map_name][type_id] = name
+
+
+def cached_type_maps(cache_dir, sources, build):
+    """
+    Type index shared by format_1c and direct_1c exports. It is a plain dict, cheap to ship to pool workers.
+    With cache_dir it is persisted in the index cache and reused while the names and contents
+    of the source headers are unchanged.
+
+    :param sources: (name, path) of every header the index is built from
+    :param build: builds the index when there is no cache entry
+    """
+    if not cache_dir:
+        return build()
+    digest = blake2b(f'types:{TYPE_MAPS_VERSION}'.encode(), digest_size=20)
+    for name, path in sorted(sources):
+        digest.update(f'\n{name}\n'.encode())
+        try:
+            with open(path, 'rb') as file:
+                digest.update(file.read())
+        except OSError:
+            digest.update(b'-')
+    key = digest.hexdigest()
+    cache = ContainerIndexCache(cache_dir)
+    type_maps = cache.load_entry(key)
+    if type_maps is None:
+        type_maps = build()
+        cache.save_entry(key, type_maps)
+    return type_maps
+
+
+def build_type_maps(src_dir: str, cache_dir=None):
+    sources = []
+    for obj_type in TYPE_MAP_SOURCES:
+        parent_dir = os.path.join(src_dir, obj_type)
         if not os.path.isdir(parent_dir):
-            return mapping
+            continue
         for obj_name in os.listdir(parent_dir):
             obj_dir = os.path.join(parent_dir, obj_name)
-            if not os.path.isdir(obj_dir):
-                continue
+            if os.path.isdir(obj_dir):
+                sources.append((obj_type, obj_name, obj_dir))
+
+    def build():
+        type_maps = new_type_maps()
+        for obj_type, obj_name, obj_dir in sources:
             try:
-                header = helper.json_read(obj_dir, 'DefinedType.json')
-                arr = header['header'][0][1]
-                type_id = arr[1]
-                name = header.get('name', obj_name)
-                mapping[type_id] = name
+                header = helper.json_read(obj_dir, f'{obj_type}.json')
+                add_type(type_maps, obj_type, header['header'][0][1], header.get('name', obj_name))
             except Exception:
                 continue
-        return mapping
+        return type_maps
 
-    return {
-        'catalog_ref': scan_ref_types(os.path.join(src_dir, 'Catalog'), 'Catalog.json', 3),
-        'document_ref': scan_ref_types(os.path.join(src_dir, 'Document'), 'Document.json', 3),
-        'defined_type': scan_defined_types(os.path.join(src_dir, 'DefinedType')),
-    }
+    return cached_type_maps(cache_dir, [
+        (f'{obj_type}/{obj_name}', os.path.join(obj_dir, f'{obj_type}.json')) for obj_type, obj_name, obj_dir in sources
+    ], build)
 
 
 def resolve_full_attribute_type(pattern: list, type_maps: dict):
@@ -1,44 +1,159 @@
 import copy
+import heapq
+import importlib
+import itertools
 import json
 import os
+import pkgutil
+import queue
 import shutil
+import threading
 import time
 import uuid
+from collections import OrderedDict
 from codecs import BOM_UTF8, BOM_UTF16_BE, BOM_UTF16_LE, BOM_UTF32_BE, BOM_UTF32_LE
 from multiprocessing import Pool, cpu_count
 
 from tqdm.auto import tqdm
 
 from .ext_exception import ExtException
-from .json_container_decoder import JsonContainerDecoder, BigBase64
-
+from .json_container_decoder import JsonContainerDecoder, BigBase64, Base64Blob
+
+
+# кэш разобранных скобкофайлов процесса: одни и те же файлы (root, version, заголовки объектов) читаются
+# за один запуск несколько раз. Ключ - путь, запись действительна пока не изменились размер и время изменения
+# файла, вытесняются давно прочитанные
+BRACE_FILE_CACHE_SIZE = 256
+# большие файлы не кэшируются, суммарный размер файлов в кэше ограничен, чтобы кэш не держал память процесса (байт)
+BRACE_FILE_CACHE_MAX_FILE_SIZE = 0x40000
+BRACE_FILE_CACHE_MAX_TOTAL_SIZE = 0x1000000
+_brace_file_cache = OrderedDict()
+_brace_file_cache_info = {'hits': 0, 'misses': 0, 'total_size': 0}
+# кэш используется и из потоков основного процесса при одновременной обработке нескольких продуктов
+_brace_file_cache_lock = threading.Lock()
+
+# планирование заданий пула по стоимости (см. task_cost): на процесс приходится несколько пачек заданий,
+# к стоимости каждого задания добавляются накладные расходы на его запуск, длина пачки ограничена
+CHUNKS_PER_PROCESS = 4
+TASK_COST_OVERHEAD = 0x1000
+MAX_CHUNK_LENGTH = 64
+# run_in_pool_tree держит в пуле не больше заданий на процесс, остальные ждут в основном процессе и при ошибке
+# отменяются; ожидание результатов прерывается для проверки, что процессы пула живы (секунд)
+POOL_TREE_TASKS_PER_PROCESS = 2
+POOL_POLL_TIMEOUT = 1
+
+
+def brace_file_read(path, file_name, *, lazy_base64=False):
+    """
+    Разбирает скобкофайл. Результат кэшируется в процессе (см. BRACE_FILE_CACHE_SIZE), вызывающий всегда
+    получает свою копию данных и может ее изменять.
 
-def brace_file_read(path, file_name):
+    :param lazy_base64: блоки base64 вернуть как Base64Blob, без сборки в строку, для извлечения в двоичный файл,
+        такой результат не кэшируется
+    :type lazy_base64: bool
+    """
     _path = os.path.normpath(os.path.join(path, file_name))
     try:
-        for code_page in ['utf-8-sig', 'windows-1251']:
-            try:
-                with open(_path, 'r', encoding=code_page) as file:
-                    decoder = JsonContainerDecoder(src_dir=path, file_name=file_name)
-                    data = decoder.decode_file(file)
-                    return data
-            except UnicodeDecodeError:
-                continue
-        raise ExtException(message=f'Unknown code page in file {file_name}')
+        stat = os.stat(_path)
+        version = None
+        if not lazy_base64 and stat.st_size <= BRACE_FILE_CACHE_MAX_FILE_SIZE:
+            version = stat.st_size, stat.st_mtime_ns
+            with _brace_file_cache_lock:
+                cached = _brace_file_cache.get(_path)
+                if cached is not None and cached[0] == version:
+                    _brace_file_cache.move_to_end(_path)
+                    _brace_file_cache_info['hits'] += 1
+                else:
+                    cached = None
+                    _brace_file_cache_info['misses'] += 1
+            if cached is not None:
+                return _copy_brace_data(cached[1])
+        try:
+            text = brace_text_read(path, file_name)[0]
+        except UnicodeDecodeError:
+            raise ExtException(message=f'Unknown code page in file {file_name}')
+        decoder = JsonContainerDecoder(src_dir=path, file_name=file_name, lazy_base64=lazy_base64)
+        data = decoder.decode_text(text)
+        if version is None:
+            return data
+        _brace_file_cache_put(_path, version, data)
+        return _copy_brace_data(data)
     except (BigBase64, FileNotFoundError) as err:
         raise err from err
     except Exception as err:
         raise ExtException(parent=err, message='Ошибка чтения', detail=f'{err} в файле ({_path})')
 
 
+def _brace_file_cache_put(path, version, data):
+    with _brace_file_cache_lock:
+        _brace_file_cache_put_locked(path, version, data)
+
+
+def _brace_file_cache_put_locked(path, version, data):
+    cached = _brace_file_cache.pop(path, None)
+    if cached is not None:
+        _brace_file_cache_info['total_size'] -= cached[0][0]
+    _brace_file_cache[path] = version, data
+    _brace_file_cache_info['total_size'] += version[0]
+    while len(_brace_file_cache) > BRACE_FILE_CACHE_SIZE or \
+            _brace_file_cache_info['total_size'] > BRACE_FILE_CACHE_MAX_TOTAL_SIZE:
+        _brace_file_cache_info['total_size'] -= _brace_file_cache.popitem(last=False)[1][0][0]
+
+
+def brace_file_cache_info():
+    """
+    Статистика кэша скобкофайлов текущего процесса
+
+    :return: количество попаданий и промахов, количество и суммарный размер файлов в кэше
+    :rtype: dict
+    """
+    return dict(_brace_file_cache_info, size=len(_brace_file_cache))
+
+
+def brace_file_cache_clear():
+    with _brace_file_cache_lock:
+        _brace_file_cache.clear()
+        _brace_file_cache_info.update(hits=0, misses=0, total_size=0)
+
+
+def _copy_brace_data(data):
+    # строки неизменяемы, копируются только списки
+    if isinstance(data, list):
+        return [_copy_brace_data(elem) if isinstance(elem, list) else elem for elem in data]
+    return data
+
+
+def brace_text_read(path, file_name):
+    """
+    Читает скобкофайл одним чтением с диска. Кодировка определяется один раз: utf-8 (с BOM или без),
+    если байты проходят проверку при декодировании, иначе windows-1251.
+    Переводы строк приводятся к \\n, как при чтении файла в текстовом режиме.
+
+    :return: текст и кодировка
+    :rtype: tuple
+    :raises UnicodeDecodeError: файл не в одной из этих кодировок
+    """
+    _path = os.path.normpath(os.path.join(path, file_name))
+    with open(_path, 'rb') as file:
+        raw = file.read()
+    try:
+        text, encoding = raw.decode('utf-8-sig'), 'utf-8-sig'
+    except UnicodeDecodeError:
+        text, encoding = raw.decode('windows-1251'), 'windows-1251'
+    del raw
+    if '\r' in text:
+        text = text.replace('\r\n', '\n')
+        if '\r' in text:
+            text = text.replace('\r', '\n')
+    return text, encoding
+
+
 def brace_file_write(data, path, file_name):
     _path = os.path.normpath(os.path.join(path, file_name))
     makedirs(path, exist_ok=True)
     try:
-        with open(_path, 'w', encoding='utf-8') as file:
-            decoder = JsonContainerDecoder(src_dir=path, file_name=file_name)
-            raw_data = decoder.encode_root_object(data)
-            decoder.write_data(path, file_name, raw_data)
+        decoder = JsonContainerDecoder(src_dir=path, file_name=file_name)
+        decoder.write_root_object_file(path, file_name, data)
     except Exception as err:
         raise ExtException(message='Ошибка записи', detail=f'{err} в файле ({_path})')
 
@@ -59,7 +174,7 @@ def json_write(data, path, file_name):
     makedirs(path, exist_ok=True)
     try:
         with open(_path, 'w', encoding='utf-8') as file:
-            json.dump(data, file, ensure_ascii=False, indent=2)
+            json.dump(data, file, ensure_ascii=False, indent=2, default=str)  # Base64Blob пишется строкой
     except Exception as err:
         raise ExtException(message='Ошибка записи', detail=f'{err} в файле ({_path})')
 
@@ -103,7 +218,10 @@ def bin_write(data, path, file_name):
     _path = os.path.normpath(os.path.join(path, file_name))
     makedirs(path, exist_ok=True)
     with open(_path, 'wb') as file:
-        file.write(data)
+        if isinstance(data, Base64Blob):
+            data.decode_to(file)
+        else:
+            file.write(data)
 
 
 def bin_read(path, file_name):
@@ -175,12 +293,29 @@ def str_decode(data: str) -> str:
     return data[1:-1]
 
 
-def get_pool(*, pool: Pool = None, processes=None) -> Pool:
+def get_pool(*, pool: Pool = None, processes=None, initializer=None) -> Pool:
     if pool is not None:
         return pool
     if processes is None:
         processes = max(cpu_count() - 2, 1)  # чтобы система совсем не висла
-    return Pool(processes)
+    return Pool(processes, initializer=initializer)
+
+
+def init_pool_worker():
+    """
+    Инициализация процесса долгоживущего пула (build_all, extract_all): заранее импортирует обработчики
+    объектов метаданных, чтобы задания всех продуктов не тратили время на импорт
+    """
+    from . import MetaDataObject
+    for module in pkgutil.iter_modules(MetaDataObject.__path__):
+        importlib.import_module(f'{MetaDataObject.__name__}.{module.name}')
+
+
+def get_pool_processes(pool: Pool):
+    """
+    Количество процессов пула, None если пул его не сообщает
+    """
+    return getattr(pool, '_processes', None)
 
 
 def close_pool(local_pool: Pool, pool: Pool = None) -> None:
@@ -189,15 +324,99 @@ def close_pool(local_pool: Pool, pool: Pool = None) -> None:
         local_pool.join()
 
 
+def task_cost(get_cost):
+    """
+    Декоратор метода заданий пула: задает оценку стоимости задания, обычно размер входных файлов.
+    run_in_pool отправляет в пул сначала самые дорогие задания, а мелкие объединяет в пачки
+
+    :param get_cost: функция (задание) -> стоимость
+    """
+
+    def decorator(method):
+        method.get_task_cost = get_cost
+        return method
+
+    return decorator
+
+
+def get_path_size(path):
+    """
+    :return: размер файла или суммарный размер файлов папки, 0 если пути нет
+    :rtype: int
+    """
+    try:
+        if not os.path.isdir(path):
+            return os.path.getsize(path)
+        size = 0
+        for root, dirs, files in os.walk(path):
+            for file_name in files:
+                size += os.path.getsize(os.path.join(root, file_name))
+        return size
+    except OSError:
+        return 0
+
+
+def get_source_file_cost(params):
+    """
+    Стоимость задания, первые элементы которого - папка, путь и имя исходного файла
+    """
+    return get_path_size(os.path.join(*params[:3]))
+
+
+def get_task_chunks(list_args, get_cost, processes=None):
+    """
+    Упорядочивает задания от самых дорогих к дешевым и объединяет дешевые задания в пачки так,
+    чтобы на каждый процесс пула приходилось несколько пачек сравнимой стоимости
+
+    :param get_cost: функция (задание) -> стоимость
+    :param processes: количество процессов пула
+    :return: список пачек заданий
+    :rtype: list
+    """
+    tasks = sorted(((get_cost(task) + TASK_COST_OVERHEAD, task) for task in list_args),
+                   key=lambda elem: elem[0], reverse=True)
+    target_cost = sum(cost for cost, task in tasks) / ((processes or cpu_count()) * CHUNKS_PER_PROCESS)
+    chunks = []
+    chunk = []
+    chunk_cost = 0
+    for cost, task in tasks:
+        if cost >= target_cost:
+            chunks.append([task])
+            continue
+        chunk.append(task)
+        chunk_cost += cost
+        if chunk_cost >= target_cost or len(chunk) >= MAX_CHUNK_LENGTH:
+            chunks.append(chunk)
+            chunk = []
+            chunk_cost = 0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def run_task_chunk(params):
+    method, tasks = params
+    return [method(task) for task in tasks]
+
+
 def run_in_pool(method, list_args, pool=None, title=None, need_result=False):
     _pool = get_pool(pool=pool)
     result = []
+    get_cost = getattr(method, 'get_task_cost', None)
     try:
         with tqdm(desc=title, total=len(list_args)) as pbar:
-            for _res in _pool.imap_unordered(method, list_args, chunksize=1):
-                if need_result and _res:
-                    result.extend(_res)
-                pbar.update()
+            if get_cost is None:
+                chunks = ([_res] for _res in _pool.imap_unordered(method, list_args, chunksize=1))
+            else:
+                chunks = _pool.imap_unordered(
+                    run_task_chunk,
+                    [(method, chunk) for chunk in get_task_chunks(list_args, get_cost, get_pool_processes(_pool))],
+                    chunksize=1)
+            for chunk in chunks:
+                for _res in chunk:
+                    if need_result and _res:
+                        result.extend(_res)
+                pbar.update(len(chunk))
     except ExtException as err:
         raise ExtException(
             parent=err,
@@ -207,6 +426,103 @@ def run_in_pool(method, list_args, pool=None, title=None, need_result=False):
     return result
 
 
+def run_in_pool_tree(method, list_args, pool=None, title=None, get_child_tasks=None):
+    """
+    Выполняет задания в пуле процессов вместе со всеми порожденными ими заданиями.
+    Вложенные задания отправляются в пул сразу по завершении родителя, не дожидаясь остальных заданий его уровня,
+    поэтому один долгий объект не останавливает остальные процессы пула.
+    При ошибке задания еще не отправленные в пул отменяются, а выполняющиеся дожидаются завершения,
+    чтобы не занимать общий пул. Если процесс пула аварийно завершился, его задание потеряно -
+    пул останавливается и вызывается исключение, см. check_pool_workers.
+
+    :param method: метод задания, возвращает список вложенных заданий
+    :param list_args: начальные задания
+    :param get_child_tasks: получает из задания и результата метода (task, result) список вложенных заданий,
+        вызывается в основном процессе в порядке завершения заданий.
+        По умолчанию результат метода и есть список вложенных заданий
+    """
+    _pool = get_pool(pool=pool)
+    completed = queue.SimpleQueue()
+    get_cost = getattr(method, 'get_task_cost', None)
+    max_running = (get_pool_processes(_pool) or cpu_count()) * POOL_TREE_TASKS_PER_PROCESS
+    workers = get_pool_workers(_pool)
+    pending = []  # куча (-стоимость, порядковый номер, задание): первыми в пул уходят самые дорогие задания
+    order = itertools.count()
+    running = 0
+
+    def wait_completed():
+        while True:
+            try:
+                return completed.get(timeout=POOL_POLL_TIMEOUT)
+            except queue.Empty:
+                check_pool_workers(_pool, workers)
+
+    try:
+        with tqdm(desc=title, total=0) as pbar:
+            def submit(tasks):
+                nonlocal running
+                if tasks:
+                    pbar.total += len(tasks)
+                    pbar.refresh()
+                    for task in tasks:
+                        heapq.heappush(pending, (-get_cost(task) if get_cost is not None else 0, next(order), task))
+                while pending and running < max_running:
+                    task = heapq.heappop(pending)[2]
+                    _pool.apply_async(method, (task,),
+                                      callback=lambda res, _task=task: completed.put((_task, True, res)),
+                                      error_callback=lambda err, _task=task: completed.put((_task, False, err)))
+                    running += 1
+
+            try:
+                submit(list_args)
+                while running:
+                    task, success, res = wait_completed()
+                    running -= 1
+                    if not success:
+                        raise res
+                    submit(get_child_tasks(task, res) if get_child_tasks is not None else res)
+                    pbar.update()
+            except BaseException:
+                pending.clear()
+                try:
+                    while running:
+                        wait_completed()
+                        running -= 1
+                except ExtException:
+                    pass  # задание аварийно завершившегося процесса дождаться нельзя, исходная ошибка важнее
+                raise
+    except ExtException as err:
+        raise ExtException(
+            parent=err,
+            action=f'run_in_pool_tree {method.__qualname__}') from err
+    finally:
+        close_pool(_pool, pool)
+
+
+def get_pool_workers(pool: Pool):
+    """
+    Идентификаторы процессов пула, см. check_pool_workers
+    """
+    return {getattr(process, 'pid', None) for process in getattr(pool, '_pool', ())}
+
+
+def check_pool_workers(pool: Pool, workers):
+    """
+    Проверяет, что процессы пула, запущенные к началу выполнения заданий, живы.
+    Пул заменяет аварийно завершившийся процесс новым, а задание этого процесса теряется и никогда не завершится.
+    Такой пул уже нельзя закрыть штатно (join вечно ждет потерянное задание), поэтому он останавливается
+
+    :param workers: идентификаторы процессов, полученные get_pool_workers
+    """
+    if getattr(pool, '_maxtasksperchild', None):
+        return  # процессы штатно заменяются после заданного количества заданий
+    lost = workers - get_pool_workers(pool)
+    if lost:
+        pool.terminate()
+        raise ExtException(message='Процесс пула аварийно завершился, его задание потеряно',
+                           detail=f'pid {", ".join(str(pid) for pid in sorted(lost))}')
+
+
 def file_size(file):
     """
     Возвращает размер file-like объекта
@@ -223,49 +539,6 @@ def file_size(file):
     return size
 
 
-def run_in_pool_encode_include(method, list_args, pool=None, title=None):
-    _pool = get_pool(pool=pool)
-    file_list = []
-    include_index = {}
-    object_task = []
-    child_tasks = []
-    try:
-        with tqdm(desc=title, total=len(list_args)) as pbar:
-            for _object_task, _child_tasks in _pool.imap_unordered(method, list_args, chunksize=1):
-                if _child_tasks:
-                    child_tasks.extend(_child_tasks)
-                if isinstance(_object_task, list):
-                    object_task.append(_object_task)
-                elif isinstance(_object_task, dict):
-                    parent_id = _object_task['parent_id']
-                    obj_data = _object_task['obj_data']
-
-                    if _object_task['file_list']:
-                        file_list.extend(_object_task['file_list'])
-                    if obj_data:
-                        obj_uuid = _object_task['obj_uuid']
-                        obj_type = _object_task['obj_type']
-                        if parent_id not in include_index:
-                            include_index[parent_id] = {}
-                        if obj_type not in include_index[parent_id]:
-                            include_index[parent_id][obj_type] = []
-                        include_index[parent_id][obj_type].append((obj_uuid, _object_task['obj_name'], obj_data))
-                elif _object_task is None:
-                    pass
-                else:
-                    raise NotImplementedError()
-                pbar.update()
-    except ExtException as err:
-        raise ExtException(
-            parent=err,
-            action=f'run_in_pool {method.__qualname__}') from None
-    # except Exception as err:
-    #     raise ExtException(parent=err, detail=f'{method.__qualname__ {err.message}' action=f'run_in_pool {method.__qualname__}') from err
-    finally:
-        close_pool(_pool, pool)
-    return file_list, include_index, object_task, child_tasks
-
-
 def list_merge(*args):
     result = []
     for lst in args:
@@ -1,12 +1,33 @@
 import json
 import os
+import re
 import shutil
-from base64 import b64decode
+from base64 import b64decode, b64encode
 from enum import Enum
+from string import ascii_letters, digits
 
 from . import helper
 from .ext_exception import ExtException
 
+# разбираемые за одну итерацию участки скобкофайла в режиме READ_PARAM: открывающая скобка в начале строки
+# (кроме base64), возможно вместе с предшествующим переводом строки; перевод строки и закрывающая скобка;
+# законченное значение параметра вместе с разделителем - простые символы и закрытые в той же строке строки
+# с символами после них
+VALUE_RE = re.compile(r'(\n)?^(\{)(?!#base64)|(\n})|([^,}"\n]*(?:"[^"\n]*"[^",}\n]*)*)([,}])', re.MULTILINE)
+# значение параметра до разделителя
+PARAM_RE = re.compile(r'[^,}"\n]*')
+# продолжение строки: символы и экранированные кавычки "", затем закрывающая кавычка, если она есть
+STRING_RE = re.compile(r'[^"]*(?:""[^"]*)*(")?')
+# символы после закрывающей кавычки строки до разделителя
+AFTER_STRING_RE = re.compile(r'[^",}]*')
+
+# строка только из символов алфавита base64, и она же с дополнением в конце
+BASE64_ALPHABET_RE = re.compile(r'[A-Za-z0-9+/]*')
+BASE64_PADDED_RE = re.compile(r'[A-Za-z0-9+/]*={1,2}')
+BASE64_ALPHABET_DELETE = str.maketrans('', '', ascii_letters + digits + '+/')
+# строк base64 по 64 символа в одной записываемой части
+BASE64_LINES_IN_CHUNK = 1024
+
 
 class Mode(Enum):
     READ_PARAM = 1
@@ -19,8 +40,13 @@ class Mode(Enum):
 
 
 class JsonContainerDecoder:
-    def __init__(self, *, src_dir=None, file_name=None):
+    def __init__(self, *, src_dir=None, file_name=None, lazy_base64=False):
+        """
+        :param lazy_base64: блоки base64 возвращать как Base64Blob, не собирая их в строку
+        :type lazy_base64: bool
+        """
         self.data = None
+        self.lazy_base64 = lazy_base64
         self.raw_data = None
         self.mode = Mode.READ_PARAM
         self.current_object = None
@@ -31,6 +57,15 @@ class JsonContainerDecoder:
         self.path = []
         self.params_in_line = 0
         self.line_number = None
+        self._tokens = {}
+        self._line_handlers = {
+            Mode.READ_PARAM: self._decode_line_read_param,
+            Mode.BEGIN_READ_STRING_VALUE: self._decode_line_begin_read_string_value,
+            Mode.BEGIN_READ_MULTI_STRING_VALUE: self._decode_line_begin_read_multi_string_value,
+            Mode.END_READ_MULTI_STRING_VALUE: self._decode_line_end_read_multi_string_value,
+            Mode.READ_B64: self._decode_line_read_b64,
+            Mode.READ_TEXT_FILE: self._decode_line_read_text_file,
+        }
 
     @classmethod
     def decode_mp(cls, params):
@@ -43,35 +78,21 @@ class JsonContainerDecoder:
         self = cls(src_dir=src_dir, file_name=file_name)
         encoding = None
         read_as_byte = True
-        for code_page in ['utf-8-sig', 'windows-1251']:
-            try:
-                with open(os.path.join(src_dir, file_name), 'r', encoding=code_page) as entry_file:  # replace BOM
-                    try:
-                        if entry_file.read(1) == '{':
-                            entry_file.seek(0)
-                            json.load(entry_file)  # если в файле чистый json воспринимаем его как бинарный файл
-                            read_as_byte = True
-                        else:
-                            read_as_byte = True
-                    except json.JSONDecodeError as err:
-                        entry_file.seek(0)
-                        data = self.decode_file(entry_file)
-                        read_as_byte = False
-                        encoding = code_page
-                        break
-            except UnicodeDecodeError:
-                continue
-            #     try:
-            #         with open(os.path.join(src_dir, file_name), 'r', encoding='windows-1251') as entry_file:  # replace BOM
-            #             data = self.decode_file(entry_file)
-            #             encoding = 'windows-1251'
-            #     except UnicodeDecodeError:
-            #         read_as_byte = True
-            except BigBase64:
-                shutil.copy2(os.path.join(src_dir, file_name), os.path.join(dest_dir, file_name + '.c1b64'))
-                return
-            except Exception as err:
-                raise ExtException(parent=err, message=f'Json decode {file_name} error: {err}')
+        try:
+            text, encoding = helper.brace_text_read(src_dir, file_name)
+            if text.startswith('{'):
+                try:
+                    json.loads(text)  # если в файле чистый json воспринимаем его как бинарный файл
+                except json.JSONDecodeError:
+                    data = self.decode_text(text)
+                    read_as_byte = False
+        except UnicodeDecodeError:
+            pass
+        except BigBase64:
+            shutil.copy2(os.path.join(src_dir, file_name), os.path.join(dest_dir, file_name + '.c1b64'))
+            return
+        except Exception as err:
+            raise ExtException(parent=err, message=f'Json decode {file_name} error: {err}')
         if read_as_byte:
             shutil.copy2(os.path.join(src_dir, file_name), os.path.join(dest_dir, file_name + '.bin'))
             # with open(os.path.join(src_dir, file_name), 'rb') as entry_file:
@@ -92,13 +113,54 @@ class JsonContainerDecoder:
                 raise Exception(f'Не поддерживаемый тип данных {type(data)}')
 
     def decode_file(self, file):
+        return self.decode_text(file.read())
+
+    def decode_text(self, text):
+        """
+        Разбирает текст скобкофайла, прочитанный целиком. Законченные значения, переводы строк перед скобками,
+        блоки base64 и текст разбираются участками по всему буферу, остальное - построчно.
+        """
         self.mode = Mode.READ_PARAM
         self.data = []
         self.line_number = 1
-        for line in file:
+        pos = 0
+        end = len(text)
+        while pos < end:
             try:
-                self.decode_line(line)
-                self.line_number += 1
+                if self.mode == Mode.READ_TEXT_FILE:
+                    self.data += text[pos:]
+                    break
+                line_start = pos == 0 or text[pos - 1] == '\n'
+                if self.mode == Mode.READ_PARAM and (
+                        not line_start or text[pos] == '}' or text[pos] == '{' and not text.startswith('{#base64', pos)):
+                    pos = self._decode_values(text, pos)
+                    if pos == end:
+                        break
+                    line_start = pos == 0 or text[pos - 1] == '\n'
+                elif self.lazy_base64 and self.mode == Mode.READ_PARAM and text.startswith('{#base64:', pos):
+                    b64_end = self._decode_lazy_base64(text, pos)
+                    if b64_end is not None:
+                        pos = b64_end
+                        continue
+                elif self.mode == Mode.READ_B64 and line_start:
+                    b64_end = text.find('}', pos)
+                    if b64_end >= 0:
+                        chunk = text[pos:b64_end]
+                        self.line_number += chunk.count('\n')
+                        self.current_value += chunk.replace('\n', '')
+                        self._end_current_object()
+                        pos = b64_end + 1
+                        continue
+                line_end = text.find('\n', pos) + 1 or end
+                if line_start:
+                    self.decode_line(text[pos:line_end])
+                else:
+                    # остаток строки: перевод строки, незакрытая или многострочная строка
+                    line_begin = text.rfind('\n', 0, pos) + 1
+                    self.decode_object(text[line_begin:line_end], pos - line_begin)
+                if text[line_end - 1] == '\n':
+                    self.line_number += 1
+                pos = line_end
             except BigBase64 as err:
                 raise err from err
             except Exception as err:
@@ -127,7 +189,10 @@ class JsonContainerDecoder:
         return self.data
 
     def decode_line(self, line):
-        handler = getattr(self, f'_decode_line_{self.mode.name.lower()}')
+        try:
+            handler = self._line_handlers[self.mode]
+        except KeyError:
+            raise AttributeError(f'_decode_line_{self.mode.name.lower()}') from None
         return handler(line)
 
     def _decode_line_read_b64(self, line):
@@ -140,20 +205,9 @@ class JsonContainerDecoder:
 
     def _decode_line_read_param(self, line):
         if line[0] == '{':  # новый объект, исходим из того, что формат записи предполагает только один новый объект
-            if self.current_object is None:
-                self.current_object = []
-                self.data.append(self.current_object)
-                self.path.append(self.current_object)
-            else:
-                self.current_object.append([])
-                self.current_object = self.current_object[-1]
-                self.path.append(self.current_object)
-
-            self.current_value = ''
+            self._begin_object()
             if line.startswith('{#base64'):
-                # это скорее всего файл целиком из двоичных данных
-                if len(self.data) == 1 and len(self.data[0]) == 2 and self.data[0][0] == '1':
-                    raise BigBase64()
+                self._check_big_base64()
                 self.mode = Mode.READ_B64
                 self.decode_b64_line(line, 1)
             else:
@@ -179,50 +233,166 @@ class JsonContainerDecoder:
                     message='Неожиданное начало объекта',
                     detail=f'в файле :{self.src_dir}/{self.file_name}, path:{self.path})')
 
+    def _begin_object(self):
+        if self.current_object is None:
+            self.current_object = []
+            self.data.append(self.current_object)
+            self.path.append(self.current_object)
+        else:
+            self.current_object.append([])
+            self.current_object = self.current_object[-1]
+            self.path.append(self.current_object)
+
+        self.current_value = ''
+
+    def _check_big_base64(self):
+        # это скорее всего файл целиком из двоичных данных
+        if len(self.data) == 1 and len(self.data[0]) == 2 and self.data[0][0] == '1':
+            raise BigBase64()
+
+    def _decode_lazy_base64(self, text, pos):
+        """
+        Разбирает блок base64 с начала строки до закрывающей скобки без склеивания строк:
+        значением объекта становится Base64Blob - ссылка на участок прочитанного текста
+
+        :return: позиция после закрывающей скобки или None, если блок не закрыт
+        """
+        b64_end = text.find('}', pos)
+        if b64_end < 0:
+            return None
+        self._begin_object()
+        self._check_big_base64()
+        lines = text.count('\n', pos, b64_end)
+        prefix = '#base64:' if lines else '##base64:'  # ## - b64 не разбит на строки
+        self.current_value = Base64Blob(prefix, text=text, start=pos + 9, end=b64_end)
+        self.line_number += lines
+        self._end_current_object()
+        return b64_end + 1
+
     def _decode_line_begin_read_string_value(self, line):
         self.decode_object(line)
 
-    def decode_object(self, line):
-        for i, char in enumerate(line):
+    def decode_object(self, line, pos=0):
+        """
+        Разбирает остаток строки скобкофайла. Символы не перебираются по одному: регулярными выражениями
+        выделяются целые участки - значение параметра до разделителя, строка до закрывающей кавычки,
+        состояние меняется только на разделителях и кавычках.
+        """
+        end = len(line)
+        while pos < end:
             if self.mode == Mode.READ_PARAM:
+                match = PARAM_RE.match(line, pos)
+                if match.end() > pos:
+                    self._add_to_current_value(match.group())
+                    pos = match.end()
+                    if pos == end:
+                        break
+                char = line[pos]
                 if char == ',':
                     self._end_value()
                 elif char == '}':
                     self._end_current_object()
                 elif char == '"':
-                    if line.endswith(',"\n') and i == len(line) - 2:
+                    if pos == end - 2 and line.endswith(',"\n'):
                         self.mode = Mode.BEGIN_READ_MULTI_STRING_VALUE
-                        self._add_to_current_value(line[i:])
+                        self._add_to_current_value(line[pos:])
                         break
                     else:
                         self.mode = Mode.BEGIN_READ_STRING_VALUE
                         self._add_to_current_value(char)
-                    pass
-                elif char == '\n':
+                else:  # \n
                     break
-                else:
-                    self._add_to_current_value(char)
+                pos += 1
             elif self.mode == Mode.BEGIN_READ_STRING_VALUE:
-                if char == '"':
+                # строка целиком, включая экранированные "" и закрывающую кавычку, если она есть в этой строке
+                match = STRING_RE.match(line, pos)
+                if match.end() > pos:
+                    self._add_to_current_value(match.group())
+                    pos = match.end()
+                if match.group(1):
                     self.mode = Mode.END_READ_STRING_VALUE
-                    self._add_to_current_value(char)
-                else:
-                    self._add_to_current_value(char)
             elif self.mode == Mode.END_READ_STRING_VALUE:
+                match = AFTER_STRING_RE.match(line, pos)
+                if match.end() > pos:
+                    self._add_to_current_value(match.group())
+                    pos = match.end()
+                    if pos == end:
+                        break
+                char = line[pos]
                 if char == '"':
                     self.mode = Mode.BEGIN_READ_STRING_VALUE
                     self._add_to_current_value(char)
                 elif char == ',':
                     self._end_value()
-                elif char == '}':
+                else:  # }
                     self._end_current_object()
-                else:
-                    self._add_to_current_value(char)
+                pos += 1
             else:
-                raise NotImplemented(f'mode {self.mode}')
-        # if self.current_value:
-        #     self.current_object.append(self.current_value)
-        #     self.current_value = ''
+                raise NotImplementedError(f'mode {self.mode}')
+
+    def _decode_values(self, text, pos):
+        """
+        Разбирает подряд идущие законченные значения параметров в режиме READ_PARAM, начиная с позиции pos.
+        Строки, начинающиеся с открывающей или закрывающей скобки, разбираются здесь же.
+        Действия те же, что у _end_value, _end_current_object и _decode_line_read_param, но без вызова методов
+        на каждое значение.
+
+        :return: позиция, с которой начинается неразобранный остаток
+        :rtype: int
+        """
+        data = self.data
+        path = self.path
+        current_object = self.current_object
+        current_value = self.current_value
+        previous_char = self.previous_char
+        line_number = self.line_number
+        # повторяющиеся значения (uuid типов, числа) храним одним объектом строки
+        token = self._tokens.setdefault
+        # scanner.match сопоставляет только с конца предыдущего совпадения: поиск следующего совпадения
+        # дальше по тексту на длинных строках без разделителей слишком дорог
+        match_value = VALUE_RE.scanner(text, pos).match
+        try:
+            while True:
+                match = match_value()
+                if match is None:
+                    break
+                new_line, brace, new_line_close, value, delimiter = match.groups()
+                if brace:
+                    if new_line:
+                        line_number += 1
+                    if current_object is None:
+                        current_object = []
+                        data.append(current_object)
+                    else:
+                        current_object.append([])
+                        current_object = current_object[-1]
+                    path.append(current_object)
+                    current_value = ''
+                else:
+                    if new_line_close:
+                        line_number += 1
+                        delimiter = '}'
+                    elif value:
+                        current_value = value if current_value is None else current_value + value
+                        previous_char = value[-1]
+                    if previous_char != '}':
+                        current_object.append(token(current_value, current_value))
+                        current_value = ''
+                    if delimiter == ',':
+                        previous_char = ','
+                    else:
+                        if path:  # могут быль лишние закрывающие скобки
+                            path.pop()
+                        current_object = path[-1] if path else None
+                        current_value = None
+                        previous_char = '}'
+                pos = match.end()
+        finally:
+            self.current_object = current_object
+            self.current_value = current_value
+            self.previous_char = previous_char
+            self.line_number = line_number
+        return pos
 
     def decode_b64_line(self, line, start_pos):
         end_pos = line.find('}')
@@ -259,7 +429,7 @@ class JsonContainerDecoder:
             self.current_value += value
         except TypeError:
             self.current_value = value
-        self.previous_char = value
+        self.previous_char = value[-1]
 
     def _end_current_object(self):
         self._end_value()
@@ -296,82 +466,116 @@ class JsonContainerDecoder:
             raise ExtException(parent=err, detail=file_name) from err
 
     def encode_root_object(self, data):
-        raw_data = ''
-        for elem in data:
-            if raw_data:
-                raw_data += ',\n'
-            raw_data += self.encode_object(elem, True)
-        return raw_data
+        parts = []
+        self.write_root_object(data, parts.append)
+        return ''.join(parts)
+
+    def write_root_object(self, data, write):
+        """
+        Кодирует данные в скобкофайл, передавая его частями в write, без склеивания промежуточных строк
+
+        :param data: данные скобкофайла
+        :type data: list
+        :param write: приемник частей: метод append списка или write файла
+        :type write: callable
+        """
+        for i, elem in enumerate(data):
+            if i:
+                write(',\n')
+            self._write_object(elem, True, write)
 
     def encode_object(self, data, first=True):
+        parts = []
+        self._write_object(data, first, parts.append)
+        return ''.join(parts)
+
+    def _write_object(self, data, first, write):
         if first:
-            raw_data = '{'
+            write('{')
         else:
-            raw_data = '\n{'
+            write('\n{')
             self.params_in_line = 0
-        data_len = len(data)
-        for i in range(data_len):
-            elem = data[i]
+        last = len(data) - 1
+        for i, elem in enumerate(data):
             if isinstance(elem, list):
-                raw_data += self.encode_object(elem, False)
-                if i == data_len - 1:
-                    raw_data += '\n'
+                self._write_object(elem, False, write)
+                if i == last:
+                    write('\n')
                     self.params_in_line = 0
-                pass
             elif isinstance(elem, str):
                 if elem.startswith('#base64:'):
-                    j = 72
-                    raw_data += f'{elem[0:j]}'
-                    while j <= len(elem):
-                        raw_data += f'\r\n{elem[j: j + 64]}'
-                        j += 64
+                    write(elem[:72])
+                    self._write_base64_lines(elem, 72, len(elem) + 1, write)
                 elif elem.startswith('##base64:'):  # b64 в одну строку
-                    raw_data += elem[1:]
+                    write(elem[1:])
+                elif len(elem) > 64 and is_base64(elem):  # base64 нужно переносить
+                    write(elem[:64])
+                    self._write_base64_lines(elem, 64, len(elem), write)
                 else:
-                    j = len(elem)
-                    is_base64 = False
-                    if j > 64:  # base64 нужно переносить
-                        try:
-                            b64decode(elem)
-                            is_base64 = True
-                        except ValueError:
-                            pass
-
-                    if is_base64:
-                        _first = True
-                        while j:
-                            if _first:
-                                _first = False
-                            else:
-                                raw_data += '\r\n'
-
-                            if j > 64:
-                                raw_data += elem[:64]
-                                elem = elem[64:]
-                                j = len(elem)
-                            else:
-                                raw_data += elem
-                                break
-                    else:
-                        raw_data += elem
+                    write(elem)
+            elif isinstance(elem, Base64Blob):
+                self._write_base64_blob(elem, write)
             elif elem is None:
                 pass
             else:
                 raise NotImplementedError(elem)
 
-            if i != data_len - 1:
-                raw_data += ','
+            if i != last:
+                write(',')
                 self.params_in_line += 1
+        write('}')
 
-        raw_data += '}'
-        return raw_data
-        pass
+    @staticmethod
+    def _write_base64_lines(elem, start, stop, write):
+        """
+        Записывает строки base64 по 64 символа, каждую с новой строки, блоками по BASE64_LINES_IN_CHUNK строк
+        """
+        chunk_size = 64 * BASE64_LINES_IN_CHUNK
+        for chunk_start in range(start, stop, chunk_size):
+            lines = range(chunk_start, min(chunk_start + chunk_size, stop), 64)
+            write(''.join(['\r\n' + elem[j:j + 64] for j in lines]))
+
+    @classmethod
+    def _write_base64_blob(cls, blob, write):
+        """
+        Записывает Base64Blob частями так же, как строку с тем же префиксом: #base64: - по 64 символа в строке,
+        ##base64: - в одну строку
+        """
+        write('#base64:')
+        if blob.prefix == '##base64:':
+            for chunk in blob.chunks():
+                write(chunk)
+            return
+        size = 0  # записано символов base64
+        tail = ''
+        for chunk in blob.chunks():
+            if tail:
+                chunk = tail + chunk
+            stop = len(chunk) - len(chunk) % 64
+            if size:
+                cls._write_base64_lines(chunk, 0, stop, write)
+            elif stop:
+                write(chunk[:64])
+                cls._write_base64_lines(chunk, 64, stop, write)
+            size += stop
+            tail = chunk[stop:]
+        if tail:
+            write('\r\n' + tail if size else tail)
+        elif size:
+            write('\r\n')
 
     @staticmethod
     def write_data(dest_dir, file_name, data):
-        with open(os.path.join(dest_dir, file_name), 'w', encoding='utf-8-sig') as f:  # replace BOM
+        with open(os.path.join(dest_dir, file_name), 'w', encoding='utf-8-sig', newline='\r\n') as f:  # replace BOM
             return f.write(data)
 
+    def write_root_object_file(self, dest_dir, file_name, data):
+        """
+        Кодирует данные в скобкофайл и записывает его частями, не собирая весь текст в памяти
+        """
+        with open(os.path.join(dest_dir, file_name), 'w', encoding='utf-8-sig', newline='\r\n') as f:  # replace BOM
+            self.write_root_object(data, f.write)
+
 
 def json_decode(src_dir, dest_dir, *, pool=None):
     """
@@ -465,5 +669,112 @@ def _encode(src_dir, dest_dir, tasks):
             raise ExtException(parent=err, detail=f'{entry} {src_dir}', action='json_encode')
 
 
+def is_base64(value):
+    """
+    Проверяет, что строку примет b64decode без validate, не декодируя ее: символы вне алфавита base64
+    отбрасываются, оставшихся символов должно быть кратно 4. Декодируются только строки с символом
+    дополнения '=' не в конце.
+
+    :param value: проверяемая строка
+    :type value: string
+    :rtype: bool
+    """
+    if not value.isascii():
+        return False
+    if '=' not in value:
+        if BASE64_ALPHABET_RE.fullmatch(value):
+            return len(value) % 4 == 0
+        return (len(value) - len(value.translate(BASE64_ALPHABET_DELETE))) % 4 == 0
+    if len(value) % 4 == 0 and BASE64_PADDED_RE.fullmatch(value):
+        return True
+    try:
+        b64decode(value)
+        return True
+    except ValueError:
+        return False
+
+
 class BigBase64(Exception):
     pass
+
+
+class Base64Blob:
+    """
+    Данные base64 скобкофайла, которые не собираются в одну строку. При разборе это участок прочитанного
+    текста скобкофайла (переводы строк в нем к данным не относятся), при сборке - двоичный файл исходников.
+    Данные декодируются в файл и кодируются в скобкофайл частями по BASE64_LINES_IN_CHUNK строк.
+    """
+    # префиксы, для которых запись данных не зависит от их содержимого
+    PREFIXES = ('#base64:', '##base64:')
+
+    def __init__(self, prefix, *, text=None, start=0, end=0, path=None, size=0):
+        """
+        :param prefix: префикс строки base64 в скобкофайле
+        :type prefix: string
+        :param text: текст скобкофайла и границы данных в нем
+        :type text: string
+        :param path: путь до двоичного файла и его размер (байт)
+        :type path: string
+        """
+        self.prefix = prefix
+        self.text = text
+        self.start = start
+        self.end = end
+        self.path = path
+        self.size = size
+
+    @classmethod
+    def from_file(cls, path, file_name, prefix='#base64:'):
+        """
+        Данные двоичного файла, файл читается только при записи скобкофайла
+
+        :raises FileNotFoundError: если файла нет
+        """
+        _path = os.path.normpath(os.path.join(path, file_name))
+        return cls(prefix, path=_path, size=os.stat(_path).st_size)
+
+    def chunks(self):
+        """
+        Генератор частей строки base64 без префикса
+        """
+        if self.path is None:
+            chunk_size = 64 * BASE64_LINES_IN_CHUNK
+            for chunk_start in range(self.start, self.end, chunk_size):
+                yield self.text[chunk_start:min(chunk_start + chunk_size, self.end)].replace('\n', '')
+            return
+        with open(self.path, 'rb') as file:
+            while True:
+                data = file.read(48 * BASE64_LINES_IN_CHUNK)
+                if not data:
+                    break
+                yield b64encode(data).decode(encoding='utf-8')
+
+    def decode_to(self, file):
+        """
+        Декодирует данные в файл частями, результат тот же, что у b64decode всей строки
+
+        :param file: объект двоичного файла назначения
+        :type file: BufferedWriter
+        """
+        chunks = self.chunks()
+        tail = ''
+        for chunk in chunks:
+            if tail:
+                chunk = tail + chunk
+            if not BASE64_ALPHABET_RE.fullmatch(chunk):
+                # дополнение или символы вне алфавита: остаток декодируем целиком
+                file.write(b64decode(''.join([chunk, *chunks])))
+                return
+            stop = len(chunk) - len(chunk) % 4
+            file.write(b64decode(chunk[:stop]))
+            tail = chunk[stop:]
+        if tail:
+            file.write(b64decode(tail))
+
+    def __len__(self):
+        if self.path is None:
+            return self.end - self.start - self.text.count('\n', self.start, self.end)
+        return (self.size + 2) // 3 * 4
+
+    def __str__(self):
+        return self.prefix + ''.join(self.chunks())
@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import re
+from hashlib import blake2b
+
+from . import helper
+from .version import __version__
+
+# Версия формата манифестов, при изменении структуры старые манифесты игнорируются и выполняется полный разбор
+MANIFEST_VERSION = 1
+# Размер блока чтения файлов при подсчете хэша
+HASH_CHUNK_SIZE = 0x100000
+
+UUID_RE = re.compile(rb'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+
+
+def hash_source_entry(params):
+    """
+    Считает хэш файла или папки (раскрытого вложенного контейнера) временной папки контейнера.
+    У заголовков объектов (файлы без расширения) дополнительно собирает упомянутые в них идентификаторы -
+    по ним находятся файлы, которые читает объект.
+
+    :param params: папка контейнера, имя файла
+    :return: [(имя файла, хэш, идентификаторы или None)]
+    :rtype: list
+    """
+    src_dir, name = params
+    path = os.path.join(src_dir, name)
+    digest = blake2b(digest_size=20)
+    uuids = None
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for file_name in sorted(files):
+                file_path = os.path.join(root, file_name)
+                digest.update(f'{os.path.relpath(file_path, path)}:{os.path.getsize(file_path)}\n'.encode())
+                _hash_file(digest, file_path)
+    elif '.' in name:
+        _hash_file(digest, path)
+    else:
+        with open(path, 'rb') as file:
+            data = file.read()
+        digest.update(data)
+        uuids = sorted(set(uuid.decode() for uuid in UUID_RE.findall(data)))
+    return [(name, digest.hexdigest(), uuids)]
+
+
+def _hash_file(digest, path):
+    with open(path, 'rb') as file:
+        while True:
+            buffer = file.read(HASH_CHUNK_SIZE)
+            if not buffer:
+                break
+            digest.update(buffer)
+
+
+def get_signature(*args):
+    data = json.dumps([MANIFEST_VERSION, __version__, *args], ensure_ascii=False, sort_keys=True, default=str)
+    return blake2b(data.encode(), digest_size=20).hexdigest()
+
+
+def remove_outputs(dest_dir, outputs):
+    """
+    Удаляет файлы результата и опустевшие после этого папки, саму папку результата не трогает
+
+    :param dest_dir: папка результата
+    :param outputs: пути файлов относительно папки результата
+    """
+    dest_dir = os.path.normpath(dest_dir)
+    for output in outputs:
+        path = os.path.join(dest_dir, output)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        path = os.path.dirname(path)
+        while path != dest_dir and path.startswith(dest_dir):
+            try:
+                os.rmdir(path)
+            except OSError:  # в папке есть другие файлы
+                break
+            path = os.path.dirname(path)
+
+
+class Manifest:
+    """
+    Общая часть манифестов инкрементального разбора: загрузка, проверка сигнатуры и запись.
+    Манифест удаляется при загрузке и записывается заново только после успешного завершения этапа,
+    поэтому прерванный разбор приводит к полному разбору при следующем запуске.
+
+    :param path: путь до файла манифеста
+    :type path: string
+    :param dest_dir: папка результата этапа
+    :type dest_dir: string
+    :param signature: сигнатура параметров разбора, при её изменении выполняется полный разбор
+    :type signature: string
+    """
+
+    def __init__(self, path, dest_dir, signature):
+        self.path = path
+        self.dest_dir = dest_dir
+        self.signature = signature
+        self.old = {}
+        self.entries = {}
+
+    def load(self):
+        """
+        Загружает записи предыдущего разбора
+
+        :return: False если манифеста нет, он от других параметров или папка результата удалена
+        :rtype: bool
+        """
+        self.old = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return False
+        except Exception:
+            data = None
+        os.remove(self.path)
+        if not data or data.get('signature') != self.signature or not os.path.isdir(self.dest_dir):
+            return False
+        self.old = data['entries']
+        return True
+
+    def save(self):
+        helper.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(dict(signature=self.signature, entries=self.entries), file, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+
+class DecodeManifest(Manifest):
+    """
+    Манифест инкрементального разбора объектов метаданных (decode_stage_3).
+
+    Для каждого вложенного объекта хранит задание разбора, хэш прочитанных им файлов контейнера,
+    ключи вложенных объектов, папку объекта и созданные в ней файлы. Объект читает свой заголовок и файлы,
+    имена которых начинаются с упомянутых в заголовке идентификаторов, файлы вложенных объектов, разбираемых
+    отдельными заданиями, в хэш не входят. Неизменившиеся объекты не разбираются, их вложенные объекты
+    берутся из манифеста и проверяются так же. Файлы изменившихся и удаленных объектов удаляются
+    до того, как будут разобраны соседние объекты.
+
+    Ключ объекта - путь папки родителя в результате и имя заголовка объекта в контейнере, корневой объект - ''.
+
+    :param pool: пул процессов для подсчета хэшей
+    """
+
+    def __init__(self, path, src_dir, dest_dir, options=None, pool=None):
+        super().__init__(path, dest_dir, get_signature(options))
+        self.src_dir = src_dir
+        self.pool = pool
+        self.changed = []
+        self._pending = {}
+        self._removed = set()
+        self._sources = {}
+        self._paths = {}
+
+    @staticmethod
+    def get_key(task):
+        return os.path.join(task[1][3], task[1][1])
+
+    def get_record(self, task):
+        include_type, (src_dir, file_name, dest_dir, dest_path, parent_container_uuid, options) = task
+        return [include_type, os.path.relpath(src_dir, self.src_dir), file_name, dest_path, parent_container_uuid]
+
+    def get_task(self, record, options):
+        include_type, src_dir, file_name, dest_path, parent_container_uuid = record
+        return [include_type, [os.path.normpath(os.path.join(self.src_dir, src_dir)), file_name, self.dest_dir,
+                               dest_path, parent_container_uuid, options]]
+
+    def get_hash(self, record, children):
+        """
+        Хэш входных данных объекта: задание разбора и файлы контейнера, которые он читает
+
+        :param record: задание разбора объекта
+        :param children: ключи вложенных объектов, их файлы в хэш не входят
+        """
+        sources, uuids = self._get_source(record[1])
+        file_name = record[2]
+        names = set(uuids.get(file_name, ()))
+        names.difference_update(os.path.basename(child) for child in children)
+        names.add(file_name)
+        digest = blake2b(json.dumps(record, ensure_ascii=False).encode(), digest_size=20)
+        for name in sorted(names):
+            for entry, entry_hash in sources.get(name, ()):
+                digest.update(f'{entry}:{entry_hash}\n'.encode())
+        return digest.hexdigest()
+
+    def _get_source(self, src_dir):
+        try:
+            return self._sources[src_dir]
+        except KeyError:
+            pass
+        path = os.path.join(self.src_dir, src_dir)
+        tasks = [(path, name) for name in sorted(os.listdir(path))]
+        sources = {}
+        uuids = {}
+        for name, entry_hash, entry_uuids in helper.run_in_pool(hash_source_entry, tasks, self.pool,
+                                                               title=f'{"Проверяем изменения":30}',
+                                                               need_result=True):
+            sources.setdefault(name.split('.', 1)[0], []).append((name, entry_hash))
+            if entry_uuids is not None:
+                uuids[name] = entry_uuids
+        for entries in sources.values():
+            entries.sort()
+        self._sources[src_dir] = sources, uuids
+        return sources, uuids
+
+    def remove_root_outputs(self):
+        """
+        Корневой объект разбирается всегда, перед разбором удаляем его файлы
+        """
+        old = self.old.get('')
+        if old:
+            remove_outputs(self.dest_dir, old['outputs'])
+
+    def update(self, key, tasks):
+        """
+        Записывает результат разбора объекта и отбирает из его вложенных объектов те, которые нужно разобрать
+
+        :param key: ключ разобранного объекта
+        :param tasks: задания разбора его вложенных объектов
+        :return: задания разбора изменившихся вложенных объектов
+        :rtype: list
+        """
+        record = self._pending.pop(key, None)
+        children = [self.get_key(task) for task in tasks]
+        self.entries[key] = dict(
+            task=record,
+            hash=self.get_hash(record, children) if record else None,
+            children=children
+        )
+        self.changed.append(key)
+        old = self.old.get(key)
+        if old:
+            self._remove_tree(set(old['children']).difference(children))
+        return self._check(tasks)
+
+    def _check(self, tasks):
+        result = []
+        stack = list(tasks)
+        while stack:
+            task = stack.pop()
+            key = self.get_key(task)
+            record = self.get_record(task)
+            old = self.old.get(key)
+            if old and old['task'] == record and all(child in self.old for child in old['children']) \
+                    and old['hash'] == self.get_hash(record, old['children']):
+                self.entries[key] = old
+                options = task[1][5]
+                stack.extend(self.get_task(self.old[child]['task'], options) for child in old['children'])
+                continue
+            if old:
+                remove_outputs(self.dest_dir, old['outputs'])
+            self._pending[key] = record
+            result.append(task)
+        return result
+
+    def _remove_tree(self, keys):
+        stack = list(keys)
+        while stack:
+            key = stack.pop()
+            old = self.old.get(key)
+            if old is None or key in self.entries or key in self._removed:
+                continue
+            remove_outputs(self.dest_dir, old['outputs'])
+            self._removed.add(key)
+            stack.extend(old['children'])
+
+    def save(self):
+        """
+        Находит папки и файлы разобранных объектов, удаляет файлы недостижимых объектов и записывает манифест
+        """
+        for key in self.changed:
+            self.entries[key]['path'] = self._find_path(key)
+        roots = set(entry['path'] for entry in self.entries.values() if entry['path'] is not None)
+        for key in self.changed:
+            entry = self.entries[key]
+            entry['outputs'] = [] if entry['path'] is None else self._list_outputs(entry['path'], roots)
+        outputs = set()
+        for entry in self.entries.values():
+            outputs.update(entry['outputs'])
+        for key, old in self.old.items():
+            if key not in self.entries and key not in self._removed:
+                remove_outputs(self.dest_dir, [output for output in old['outputs'] if output not in outputs])
+        super().save()
+
+    def _find_path(self, key):
+        if not key:
+            return ''
+        dest_path, obj_uuid = os.path.split(key)
+        try:
+            paths = self._paths[dest_path]
+        except KeyError:
+            paths = self._paths[dest_path] = {}
+            try:
+                entries = os.listdir(os.path.join(self.dest_dir, dest_path))
+            except FileNotFoundError:
+                entries = []
+            for entry in entries:
+                entry_path = os.path.join(self.dest_dir, dest_path, entry)
+                if not os.path.isdir(entry_path):
+                    continue
+                for file_name in os.listdir(entry_path):
+                    if file_name.endswith('.id.json'):
+                        paths[helper.json_read(entry_path, file_name)['uuid']] = os.path.join(dest_path, entry)
+        return paths.get(obj_uuid)
+
+    def _list_outputs(self, path, roots):
+        result = []
+        for root, dirs, files in os.walk(os.path.join(self.dest_dir, path)):
+            rel_root = os.path.relpath(root, self.dest_dir)
+            if rel_root == '.':
+                rel_root = ''
+            dirs[:] = [name for name in dirs if os.path.join(rel_root, name) not in roots]
+            result.extend(os.path.join(rel_root, name) for name in files)
+        return sorted(result)
+
+
+class UnpackManifest(Manifest):
+    """
+    Манифест инкрементальной раскладки файлов по папкам исходников (OrganizerFile.unpack).
+
+    Для каждого файла decode_stage_3 хранит размер, время изменения и созданные из него файлы исходников.
+    Разбор переписывает только файлы изменившихся объектов, поэтому раскладываются только файлы
+    с другим размером или временем изменения. Файлы исходников, которые больше никто не создает, удаляются.
+    Файлы вне папки исходников (общие папки индекса) не учитываются и не удаляются, как и при полном разборе.
+
+    :param index: индекс раскладки, при его изменении выполняется полная раскладка
+    """
+
+    def __init__(self, path, dest_dir, index=None, descent=None):
+        super().__init__(path, dest_dir, get_signature(index, descent))
+        self.dest_dir = os.path.abspath(dest_dir)
+
+    def get_changed(self, src_dir):
+        """
+        :return: папка и имя изменившихся или новых файлов относительно src_dir
+        :rtype: list
+        """
+        result = []
+        for root, dirs, files in os.walk(src_dir):
+            path = os.path.relpath(root, src_dir)
+            if path == '.':
+                path = ''
+            for file_name in files:
+                key = os.path.join(path, file_name)
+                stat = os.stat(os.path.join(root, file_name))
+                stat = [stat.st_size, stat.st_mtime_ns]
+                old = self.old.get(key)
+                if old and old['stat'] == stat:
+                    self.entries[key] = old
+                    continue
+                self.entries[key] = dict(stat=stat, outputs=[])
+                result.append((path, file_name))
+        return result
+
+    def set_outputs(self, key, outputs):
+        prefix = os.path.join(self.dest_dir, '')
+        self.entries[key]['outputs'] = sorted(
+            os.path.relpath(output, self.dest_dir) for output in outputs if output.startswith(prefix))
+
+    def save(self):
+        outputs = set()
+        for entry in self.entries.values():
+            outputs.update(entry['outputs'])
+        stale = set()
+        for key, old in self.old.items():
+            if self.entries.get(key) is not old:
+                stale.update(output for output in old['outputs'] if output not in outputs)
+        remove_outputs(self.dest_dir, sorted(stale))
+        super().save()
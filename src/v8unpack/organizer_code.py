@@ -66,6 +66,7 @@ class OrganizerCode:
         return self.code_areas
 
     @classmethod
+    @helper.task_cost(helper.get_source_file_cost)
     def pack(cls, params):
         src_dir, src_path, src_file_name, dest_dir, dest_path, dest_file_name, index_code_areas, \
         descent, pack_get_descent_filename = params
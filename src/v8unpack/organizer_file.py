@@ -6,15 +6,20 @@ from . import helper
 from .ext_exception import ExtException
 from .organizer_code import OrganizerCode
 from .index import get_dest_path
+from .manifest import UnpackManifest
 from .organizer_form_elem import OrganizerFormElem
 
 
 class OrganizerFile:
 
     @classmethod
-    def unpack(cls, src_dir, dest_dir, *, pool=None, index=None, descent=None):
+    def unpack(cls, src_dir, dest_dir, *, pool=None, index=None, descent=None, manifest=None):
         begin = datetime.now()
         print(f'{"Организуем код":30}')
+        if manifest is not None:
+            cls.unpack_incremental(src_dir, dest_dir, manifest, pool=pool, index=index, descent=descent)
+            print(f'{"Организуем код - готово":30}: {datetime.now() - begin}')
+            return
         tasks_code_file = []
         tasks_form_elem = []
         helper.clear_dir(dest_dir)
@@ -37,19 +42,72 @@ class OrganizerFile:
                     new_path = os.path.join(path, entry)
                     cls._unpack(src_dir, dest_dir, new_path, tasks_code_file, tasks_form_elem, index, descent)
                     continue
-                if entry.endswith('.bsl'):
-                    tasks_code_file.append((src_dir, path, entry, dest_dir, index, descent))
-                elif entry.endswith('.elem.json'):
-                    tasks_form_elem.append((src_dir, path, entry, dest_dir, index, descent))
-                else:
-                    src_path = os.path.join(src_dir, path)
-                    cls.unpack_file(src_path, entry, dest_dir, path, entry, index, descent)
+                cls._unpack_entry(src_dir, dest_dir, path, entry, tasks_code_file, tasks_form_elem, index, descent)
             except Exception as err:
                 raise ExtException(
                     parent=err,
                     action=f'{cls.__name__}._unpack {path}.{entry}'
                 ) from err
 
+    @classmethod
+    def _unpack_entry(cls, src_dir, dest_dir, path, entry, tasks_code_file, tasks_form_elem, index, descent=None):
+        """
+        Код и элементы форм добавляются в задания, остальные файлы копируются сразу
+
+        :return: созданные файлы или None если файл добавлен в задания
+        :rtype: list
+        """
+        if entry.endswith('.bsl'):
+            tasks_code_file.append((src_dir, path, entry, dest_dir, index, descent))
+        elif entry.endswith('.elem.json'):
+            tasks_form_elem.append((src_dir, path, entry, dest_dir, index, descent))
+        else:
+            src_path = os.path.join(src_dir, path)
+            return cls.unpack_file(src_path, entry, dest_dir, path, entry, index, descent)
+
+    @classmethod
+    def unpack_incremental(cls, src_dir, dest_dir, manifest_path, *, pool=None, index=None, descent=None):
+        """
+        Раскладывает только файлы, изменившиеся с прошлой раскладки в ту же папку, и удаляет файлы,
+        которые больше ничем не создаются. Без манифеста прошлой раскладки раскладывает все и создает манифест.
+
+        :param manifest_path: путь до файла манифеста
+        :type manifest_path: string
+        """
+        dest_dir = os.path.abspath(dest_dir)
+        manifest = UnpackManifest(manifest_path, dest_dir, index, descent)
+        if not manifest.load():
+            helper.clear_dir(dest_dir)
+        tasks_code_file = []
+        tasks_form_elem = []
+        for path, entry in manifest.get_changed(src_dir):
+            try:
+                outputs = cls._unpack_entry(src_dir, dest_dir, path, entry, tasks_code_file, tasks_form_elem, index,
+                                            descent)
+                if outputs is not None:
+                    manifest.set_outputs(os.path.join(path, entry), outputs)
+            except Exception as err:
+                raise ExtException(
+                    parent=err,
+                    action=f'{cls.__name__}.unpack_incremental {path}.{entry}'
+                ) from err
+        tasks = [(cls.unpack_code_file, params) for params in tasks_code_file]
+        for key, outputs in helper.run_in_pool(cls.unpack_with_outputs, tasks, pool=pool, need_result=True,
+                                               title=f'{"Раскладываем код по файлам":30}'):
+            manifest.set_outputs(key, outputs)
+        tasks = [(OrganizerFormElem.unpack, params) for params in tasks_form_elem]
+        for key, outputs in helper.run_in_pool(cls.unpack_with_outputs, tasks, pool=pool, need_result=True,
+                                               title=f'{"Раскладываем элементы форм":30}'):
+            manifest.set_outputs(key, outputs)
+        manifest.save()
+
+    @staticmethod
+    @helper.task_cost(lambda params: helper.get_source_file_cost(params[1]))
+    def unpack_with_outputs(params):
+        method, params = params
+        src_dir, path, file_name = params[:3]
+        return [(os.path.join(path, file_name), method(params))]
+
     @classmethod
     def unpack_file(cls, src_path, src_file_name, dest_dir, dest_path, dest_file_name, index, descent=None):
         try:
@@ -74,13 +132,17 @@ class OrganizerFile:
 
             if descent_file_name:
                 shutil.copy(src_full_path, os.path.join(descent_full_dest_path, descent_file_name))
+                return [os.path.join(descent_full_dest_path, descent_file_name)]
+            return []
         except Exception as err:
             raise ExtException(parent=err, action=f'{cls.__name__}.unpack_file {src_file_name}') from err
 
     @classmethod
+    @helper.task_cost(helper.get_source_file_cost)
     def unpack_code_file(cls, params):
         src_dir, path, file_name, dest_dir, index, descent = params
         try:
+            outputs = []
             code_areas = OrganizerCode.unpack(params)
             for elem in code_areas:
                 _file = code_areas[elem]
@@ -101,6 +163,8 @@ class OrganizerFile:
 
                 if descent_file_name:
                     helper.txt_write(_file['data'], descent_full_dest_path, descent_file_name)
+                    outputs.append(os.path.join(descent_full_dest_path, descent_file_name))
+            return outputs
         except Exception as err:
             raise ExtException(
                 parent=err,
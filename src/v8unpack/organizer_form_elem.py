@@ -12,13 +12,14 @@ class OrganizerFormElem:
         self.data = None
 
     @classmethod
+    @helper.task_cost(helper.get_source_file_cost)
     def unpack(cls, params):
         src_dir, path, file_name, dest_dir, index, descent = params
         areas = {}
         elements = helper.json_read(os.path.join(src_dir, path), file_name)
         cls._unpack_get_areas(elements['tree'], '', elements['data'], areas)
         areas['root'] = elements
-        cls._unpack_write_areas(src_dir, path, file_name, dest_dir, index, descent, areas)
+        return cls._unpack_write_areas(src_dir, path, file_name, dest_dir, index, descent, areas)
 
     @staticmethod
     def is_area(name):
@@ -96,6 +97,7 @@ class OrganizerFormElem:
     @staticmethod
     def _unpack_write_areas(src_dir, path, file_name, dest_dir, index, descent, areas):
         try:
+            outputs = []
             for elem in areas:
                 if elem == 'root':
                     dest_entry_path, dest_file_name = get_dest_path(dest_dir, path, file_name, index, descent)
@@ -106,6 +108,8 @@ class OrganizerFormElem:
                 dest_path = os.path.abspath(os.path.join(dest_dir, dest_entry_path))
 
                 helper.json_write(areas[elem], dest_path, dest_file_name)
+                outputs.append(os.path.join(dest_path, dest_file_name))
+            return outputs
         except Exception as err:
             raise ExtException(
                 parent=err,
@@ -114,6 +118,7 @@ class OrganizerFormElem:
             )
 
     @classmethod
+    @helper.task_cost(helper.get_source_file_cost)
     def pack(cls, params):
         src_dir, src_path, src_file_name, dest_dir, dest_path, dest_file_name, index_code_areas, \
             descent, pack_get_descent_filename = params
@@ -238,6 +238,27 @@ class NotEqualLine(Exception):
     pass
 
 
+def read_dir(dir_name, *, exclude=(), dirs=False):
+    """
+    Считывает содержимое папки для побайтного сравнения результатов
+
+    :param exclude: имена файлов, которые не сравниваются
+    :param dirs: включить в результат папки (значение None), чтобы сравнивались и пустые папки
+    :return: {относительный путь: содержимое файла}
+    :rtype: dict
+    """
+    result = {}
+    for path, _dirs, files in os.walk(dir_name):
+        if dirs:
+            for _dir in _dirs:
+                result[os.path.relpath(os.path.join(path, _dir), dir_name)] = None
+        for file_name in files:
+            if file_name in exclude:
+                continue
+            result[os.path.relpath(os.path.join(path, file_name), dir_name)] = helper.bin_read(path, file_name)
+    return result
+
+
 def compare_file(path_decode_entry, path_encode_entry, problems):
     def ignore():
         len_decode_line = len(decode_line)
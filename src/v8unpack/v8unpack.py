@@ -3,10 +3,14 @@ import os
 import shutil
 import sys
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
 from . import helper
-from .container_reader import extract as container_extract, decompress_and_extract
+from .build_cache import BuildCache
+from .container_reader import extract as container_extract
+from .container_doc import BUFFER_CHUNK_SIZE
 from .container_writer import build as container_build, compress_and_build
 from .decoder import decode, encode
 from .ext_exception import ExtException
@@ -19,7 +23,8 @@ from .index import update_index
 from .version import __version__
 
 
-def extract(in_filename: str, out_dir_name: str, *, temp_dir=None, index=None, processes=None, options=None):
+def extract(in_filename: str, out_dir_name: str, *, temp_dir=None, index=None, processes=None, options=None,
+            pool=None):
     try:
         begin0 = datetime.now()
         if options is None:
@@ -37,39 +42,44 @@ def extract(in_filename: str, out_dir_name: str, *, temp_dir=None, index=None, p
         if format_kind not in ['json', '1c']:
             raise ExtException(message='Неподдерживаемый формат', detail=f'format={format_kind}')
 
-        if descent is None:
+        # инкрементальный разбор сравнивает с результатом прошлого разбора, который хранится во временной папке
+        incremental = bool(options.get('incremental')) and temp_dir is not None and format_kind == 'json'
+        if descent is None and not incremental:
             helper.clear_dir(os.path.normpath(out_dir_name))
         clear_temp_dir = False
         if temp_dir is None:
             clear_temp_dir = True
             temp_dir = tempfile.mkdtemp()
-        helper.clear_dir(os.path.normpath(temp_dir))
+        if not incremental:
+            helper.clear_dir(os.path.normpath(temp_dir))
 
-        dir_stage0 = os.path.join(temp_dir, 'decode_stage_0')
         dir_stage1 = os.path.join(temp_dir, 'decode_stage_1')
         # dir_stage2 = os.path.join(temp_dir, 'decode_stage_2')
         dir_stage3 = os.path.join(temp_dir, 'decode_stage_3')
+        decode_manifest = os.path.join(temp_dir, 'decode_stage_3.manifest.json') if incremental else None
+        unpack_manifest = os.path.join(temp_dir, 'unpack.manifest.json') if incremental else None
 
-        pool = helper.get_pool(processes=processes)
+        _pool = helper.get_pool(pool=pool, processes=processes)
 
-        container_extract(in_filename, dir_stage0, False, False)
-        decompress_and_extract(dir_stage0, dir_stage1, pool=pool)
+        # разархивируем и раскрываем вложенные контейнеры в памяти за один проход, минуя decode_stage_0
+        container_extract(in_filename, dir_stage1, deflate=True, recursive=True, pool=_pool,
+                          cache_dir=options.get('cache'))
 
         # json_decode(dir_stage1, dir_stage2, pool=pool)
 
         if format_kind == '1c':
-            extract_1c_direct(dir_stage1, out_dir_name, options=options, pool=pool)
+            extract_1c_direct(dir_stage1, out_dir_name, options=options, pool=_pool)
         else:
-            decode(dir_stage1, dir_stage3, pool=pool, options=options)
+            decode(dir_stage1, dir_stage3, pool=_pool, options=options, manifest=decode_manifest)
             if descent is not None:
-                OrganizerFileCE.unpack(dir_stage3, out_dir_name, pool=pool, index=index, descent=descent)
+                OrganizerFileCE.unpack(dir_stage3, out_dir_name, pool=_pool, index=index, descent=descent)
             else:
-                OrganizerFile.unpack(dir_stage3, out_dir_name, pool=pool, index=index)
+                OrganizerFile.unpack(dir_stage3, out_dir_name, pool=_pool, index=index, manifest=unpack_manifest)
 
         end = datetime.now()
         print(f'{"Готово":30}: {end - begin0}')
 
-        helper.close_pool(pool)
+        helper.close_pool(_pool, pool)
         if clear_temp_dir:
             shutil.rmtree(temp_dir, ignore_errors=True)
     except Exception as err:
@@ -77,7 +87,7 @@ def extract(in_filename: str, out_dir_name: str, *, temp_dir=None, index=None, p
 
 
 def build(in_dir_name: str, out_file_name: str, *, temp_dir=None, index=None,
-          options=None, processes: int = None):
+          options=None, processes: int = None, pool=None):
     try:
         begin0 = datetime.now()
         if options is None:
@@ -104,22 +114,29 @@ def build(in_dir_name: str, out_file_name: str, *, temp_dir=None, index=None,
         # dir_stage2 = os.path.join(temp_dir, 'encode_stage_2')
         dir_stage3 = os.path.join(temp_dir, 'encode_stage_3')
 
-        pool = helper.get_pool(processes=processes)
+        _pool = helper.get_pool(pool=pool, processes=processes)
 
         descent = options.get('descent') if options else None
         if descent is None:
-            OrganizerFile.pack(in_dir_name, dir_stage3, pool=pool, index=index)
+            OrganizerFile.pack(in_dir_name, dir_stage3, pool=_pool, index=index)
         else:
-            OrganizerFileCE.pack(in_dir_name, dir_stage3, pool=pool, index=index, descent=descent)
+            OrganizerFileCE.pack(in_dir_name, dir_stage3, pool=_pool, index=index, descent=descent)
 
-        encode(dir_stage3, dir_stage1, pool=pool, file_name=os.path.basename(out_file_name), options=options)
+        # неизменившиеся объекты берутся из кэша сборки уже собранными и сжатыми
+        build_cache = BuildCache.from_options(options)
+        encode(dir_stage3, dir_stage1, pool=_pool, file_name=os.path.basename(out_file_name), options=options,
+               build_cache=build_cache)
 
         # json_encode(dir_stage2, dir_stage1, pool=pool)
 
-        compress_and_build(dir_stage1, dir_stage0, pool=pool)
-        container_build(dir_stage0, out_file_name, True)
+        buffer_size = options.get('buffer_size', BUFFER_CHUNK_SIZE)
+        compress_and_build(dir_stage1, dir_stage0, pool=_pool, buffer_size=buffer_size,
+                           compressed=build_cache.compressed if build_cache else None)
+        if build_cache is not None:
+            build_cache.save(dir_stage1, dir_stage0)
+        container_build(dir_stage0, out_file_name, True, buffer_size=buffer_size)
 
-        helper.close_pool(pool)
+        helper.close_pool(_pool, pool)
         if clear_temp_dir:
             shutil.rmtree(temp_dir, ignore_errors=True)
 
@@ -130,48 +147,157 @@ def build(in_dir_name: str, out_file_name: str, *, temp_dir=None, index=None,
         raise ExtException(parent=err) from None
 
 
-def build_all(product_file_name: str, product_code: str = None, processes=None):
+def build_all(product_file_name: str, product_code: str = None, processes=None, parallel=None):
+    """
+    :param parallel: количество одновременно собираемых продуктов, процессы пула (processes) общие для всех
+    :type parallel: int
+    """
+
+    def build_product(product, params, pool):
+        options = params.get('options', {})
+        options['product'] = product
+        build(
+            params['src'], params['bin'],
+            temp_dir=params.get('temp'), index=params.get('index'),
+            options=options, pool=pool
+        )
+
     try:
-        products = load_json(os.path.abspath(product_file_name))
-        if product_code:
-            products = {product_code: products[product_code]}
-            products[product_code]['disable'] = False
-        for product, params in products.items():
-            if params.get('disable'):
-                continue
-            print(f'\nСобираем {product}')
-            options = params.get('options', {})
-            options['product'] = product
-            build(
-                params['src'], params['bin'],
-                temp_dir=params.get('temp'), index=params.get('index'),
-                options=options, processes=processes
-            )
-        pass
+        run_products(product_file_name, product_code, build_product, title='Собираем', log_suffix='build',
+                     processes=processes, parallel=parallel)
     except Exception as err:
         raise ExtException(parent=err)
 
 
-def extract_all(product_file_name: str, product_code: str = None, processes=None):
+def extract_all(product_file_name: str, product_code: str = None, processes=None, parallel=None):
+    """
+    :param parallel: количество одновременно разбираемых продуктов, процессы пула (processes) общие для всех
+    :type parallel: int
+    """
+
+    def extract_product(product, params, pool):
+        extract(
+            params['bin'], params['src'],
+            temp_dir=params.get('temp'), index=params.get('index'),
+            options=params.get('options'), pool=pool
+        )
+
     try:
-        products = load_json(os.path.abspath(product_file_name))
-        if product_code:
-            products = {product_code: products[product_code]}
-            products[product_code]['disable'] = False
-        for product, params in products.items():
-            if params.get('disable'):
-                continue
-            print(f'\nРазбираем {product}\n')
-            extract(
-                params['bin'], params['src'],
-                temp_dir=params.get('temp'), index=params.get('index'),
-                options=params.get('options'), processes=processes
-            )
-        pass
+        run_products(product_file_name, product_code, extract_product, title='Разбираем', log_suffix='extract',
+                     processes=processes, parallel=parallel)
     except Exception as err:
         raise ExtException(parent=err)
 
 
+def run_products(product_file_name, product_code, method, *, title, log_suffix, processes=None, parallel=None):
+    """
+    Обрабатывает продукты из файла продуктов. Один пул процессов создается на все продукты.
+    При parallel > 1 продукты обрабатываются одновременно в потоках и делят между собой процессы пула:
+    последовательные этапы одного продукта выполняются одновременно с параллельными этапами других.
+    Вывод каждого продукта пишется в свой лог: параметр продукта log или папка log рядом с файлом продуктов,
+    продукты с общей временной папкой получают в ней свои подпапки.
+
+    :param method: функция (код продукта, параметры продукта, пул)
+    :param title: действие для вывода в консоль
+    :param log_suffix: суффикс имени лога по умолчанию
+    """
+    product_file_name = os.path.abspath(product_file_name)
+    products = load_json(product_file_name)
+    if product_code:
+        products = {product_code: products[product_code]}
+        products[product_code]['disable'] = False
+    products = [(product, params) for product, params in products.items() if not params.get('disable')]
+
+    # один пул на все продукты: процессы создаются и импортируют обработчики объектов один раз
+    pool = helper.get_pool(processes=processes, initializer=helper.init_pool_worker)
+    try:
+        if not parallel or parallel < 2 or len(products) < 2:
+            for product, params in products:
+                print(f'\n{title} {product}')
+                method(product, params, pool)
+            return
+
+        temp_dirs = [params.get('temp') for product, params in products]
+        log_dir = os.path.join(os.path.dirname(product_file_name), 'log')
+        tasks = []
+        for product, params in products:
+            temp_dir = params.get('temp')
+            if temp_dir is not None and temp_dirs.count(temp_dir) > 1:
+                params = dict(params, temp=os.path.join(temp_dir, product))
+            log_file_name = params.get('log', os.path.join(log_dir, f'{product}.{log_suffix}.log'))
+            tasks.append((product, params, log_file_name))
+
+        errors = []
+        with ProductOutput() as output, ThreadPoolExecutor(parallel) as executor:
+            futures = {
+                executor.submit(output.run, log_file_name, method, product, params, pool): (product, log_file_name)
+                for product, params, log_file_name in tasks
+            }
+            for future in as_completed(futures):
+                product, log_file_name = futures[future]
+                try:
+                    future.result()
+                    print(f'{title} {product}: готово ({log_file_name})')
+                except Exception as err:
+                    errors.append((product, err))
+                    print(f'{title} {product}: ошибка ({log_file_name})')
+        if errors:
+            raise ExtException(
+                parent=errors[0][1],
+                message='Ошибка обработки продуктов',
+                detail=', '.join(product for product, err in errors)
+            )
+    finally:
+        helper.close_pool(pool)
+
+
+class ProductOutput:
+    """
+    Подменяет sys.stdout и sys.stderr на время одновременной обработки продуктов:
+    вывод потока продукта пишется в лог продукта, вывод остальных потоков - в исходный поток
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.streams = None
+
+    def __enter__(self):
+        self.streams = sys.stdout, sys.stderr
+        sys.stdout = ThreadOutput(self.local, sys.stdout)
+        sys.stderr = ThreadOutput(self.local, sys.stderr)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        sys.stdout, sys.stderr = self.streams
+
+    def run(self, log_file_name, method, *args):
+        helper.makedirs(os.path.dirname(os.path.abspath(log_file_name)), exist_ok=True)
+        with open(log_file_name, 'w', encoding='utf-8') as log:
+            self.local.log = log
+            try:
+                return method(*args)
+            except Exception as err:
+                log.write(f'\n{err}\n')
+                raise
+            finally:
+                self.local.log = None
+
+
+class ThreadOutput:
+    def __init__(self, local, stream):
+        self.local = local
+        self.stream = stream
+
+    def write(self, text):
+        return (getattr(self.local, 'log', None) or self.stream).write(text)
+
+    def flush(self):
+        return (getattr(self.local, 'log', None) or self.stream).flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
 def update_index_all(product_file_name: str, product_code: str = None, dest_dir: str = None):
     try:
         products = load_json(os.path.abspath(product_file_name))
@@ -241,6 +367,20 @@ def main():
                              "Если не указан, то сборщик не трогает оглавление, вы добавляете и убираете"
                              "вложенные объекты всегда через конфигуратор")
 
+    parser.add_argument('--cache',
+                        help="путь до папки кэша индексов бинарников, ускоряет повторный разбор тех же бинарников. "
+                             "При сборке в нем хранятся собранные и сжатые объекты, неизменившиеся объекты "
+                             "не собираются заново")
+
+    parser.add_argument("--incremental", default=False, action="store_true",
+                        help="инкрементальный разбор, только для режима -E и формата json: повторно разбираются "
+                             "только изменившиеся объекты, файлы удаленных объектов удаляются. "
+                             "Требует постоянной временной папки --temp, в ней хранится результат прошлого разбора")
+
+    parser.add_argument('--buffer_size', type=int,
+                        help="размер буфера чтения и записи файлов при сборке (байт), "
+                             f"по умолчанию {BUFFER_CHUNK_SIZE}")
+
     parser.add_argument('--format', default='json', choices=['json', '1c'],
                         help='Р¤РѕСЂРјР°С‚ СЂР°СЃРїР°РєРѕРІРєРё: json (РїРѕ СѓРјРѕР»С‡Р°РЅРёСЋ) РёР»Рё 1c')
 
@@ -251,6 +391,11 @@ def main():
                        help='собрать один или несколько файлов 1С, где '
                             'file - путь до json файла со списком продуктов и параметрами их сборки')
 
+    parser.add_argument('--parallel', type=int,
+                        help="количество продуктов, которые обрабатываются одновременно, только для режимов -EA и -BA. "
+                             "Процессы (--processes) общие для всех продуктов, вывод каждого продукта пишется в "
+                             "свой лог: параметр продукта log или папка log рядом с файлом продуктов")
+
     group.add_argument('-IA', nargs=1, metavar='file',
                        help='сформировать index по одному или нескольким продуктам, где '
                             'file - путь до json файла со списком продуктов и параметрами их сборки')
@@ -262,7 +407,8 @@ def main():
     args = parser.parse_args()
 
     options = {}
-    options_name = ['prefix', 'auto_include', 'descent', 'version', 'format']
+    options_name = ['prefix', 'auto_include', 'descent', 'version', 'format', 'cache', 'buffer_size',
+                    'incremental']
     for elem in options_name:
         value = getattr(args, elem, None)
         if value:
@@ -280,11 +426,11 @@ def main():
             return
 
         if args.BA is not None:
-            build_all(args.BA[0], args.index)
+            build_all(args.BA[0], args.index, processes=args.processes, parallel=args.parallel)
             return
 
         if args.EA is not None:
-            extract_all(args.EA[0], args.index)
+            extract_all(args.EA[0], args.index, processes=args.processes, parallel=args.parallel)
             return
 
         if args.I is not None:
@@ -0,0 +1,58 @@
+"""
+Замер скорости сборки бинарника при разных размерах буфера ввода-вывода.
+
+Запуск: python benchmark_container_writer.py [путь до бинарника] [количество повторов]
+По умолчанию используется тестовая конфигурация, для наглядного результата передайте большой cf.
+"""
+import os
+import shutil
+import sys
+import tempfile
+from timeit import default_timer
+
+sys.path.append("../src/")
+from v8unpack import helper
+from v8unpack.container_doc import BUFFER_CHUNK_SIZE
+from v8unpack.container_reader import extract as container_extract
+from v8unpack.container_writer import build as container_build, compress_and_build
+
+BUFFER_SIZES = (512, 0x10000, BUFFER_CHUNK_SIZE)
+
+
+def main():
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    src_filename = sys.argv[1] if len(sys.argv) > 1 else os.path.join(current_dir, 'Configuration803', '1Cv8.cf')
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    temp_dir = tempfile.mkdtemp()
+    pool = helper.get_pool()
+    try:
+        src_dir = os.path.join(temp_dir, 'src')
+        container_extract(src_filename, src_dir, pool=pool)
+        results = []
+        for buffer_size in BUFFER_SIZES:
+            compress_time = build_time = float('inf')
+            for i in range(repeat):
+                # calc_sha1 меняет configinfo в исходниках, поэтому каждый раз собираем из копии
+                stage1_dir = os.path.join(temp_dir, 'stage1')
+                stage0_dir = os.path.join(temp_dir, 'stage0')
+                shutil.rmtree(stage1_dir, ignore_errors=True)
+                shutil.copytree(src_dir, stage1_dir)
+                begin = default_timer()
+                compress_and_build(stage1_dir, stage0_dir, pool=pool, buffer_size=buffer_size)
+                compress_time = min(compress_time, default_timer() - begin)
+                begin = default_timer()
+                container_build(stage0_dir, os.path.join(temp_dir, 'out.cf'), True, buffer_size=buffer_size)
+                build_time = min(build_time, default_timer() - begin)
+            results.append((buffer_size, compress_time, build_time))
+
+        print(f'\n{os.path.basename(src_filename)}, лучшее время из {repeat} повторов')
+        print(f'{"buffer_size":>12} {"compress_and_build":>20} {"build":>10}')
+        for buffer_size, compress_time, build_time in results:
+            print(f'{buffer_size:>12} {compress_time:>20.3f} {build_time:>10.3f}')
+    finally:
+        helper.close_pool(pool)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
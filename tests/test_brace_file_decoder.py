@@ -1,10 +1,12 @@
+import io
 import os
 import sys
 import unittest
 
 sys.path.append("../../src/")
 from v8unpack import helper
-from v8unpack.json_container_decoder import JsonContainerDecoder
+from v8unpack.ext_exception import ExtException
+from v8unpack.json_container_decoder import JsonContainerDecoder, Base64Blob
 from v8unpack.unittest_helper import compare_file, NotEqualLine
 
 
@@ -44,3 +46,65 @@ class TestDecodeBraceFile(unittest.TestCase):
         except NotEqualLine as err:
             result = err
         return result
+
+    def test_decode_text(self):
+        text = '{2,\n{3,"a,""b""}",\n{#base64:QUJD}\n},"\nмного\nстрок",\n{4,\n{}\n}\n}'
+        decoder = JsonContainerDecoder(src_dir=self.data_dir, file_name='text')
+        self.assertEqual(
+            [['2', ['3', '"a,""b""}"', ['##base64:QUJD']], '"\nмного\nстрок"', ['4', ['']]]],
+            decoder.decode_file(io.StringIO(text)))
+
+    def test_decode_error_line(self):
+        decoder = JsonContainerDecoder(src_dir=self.data_dir, file_name='text')
+        with self.assertRaises(ExtException) as context:
+            decoder.decode_file(io.StringIO('{1,\n{2}\n}}\n},1}'))
+        self.assertTrue(context.exception.detail.endswith('проблема до строки 4'), context.exception.detail)
+
+    def test_encode_base64(self):
+        b64 = 'QUJD' * 40
+        data = [['1', '#base64:' + b64, b64, '"' + 'Строка ' * 20 + '"', ['##base64:' + b64]]]
+        self.assertEqual(
+            '{1,#base64:' + b64[:64] + '\r\n' + b64[64:128] + '\r\n' + b64[128:] + ',' +
+            b64[:64] + '\r\n' + b64[64:128] + '\r\n' + b64[128:] + ',"' + 'Строка ' * 20 + '",\n' +
+            '{#base64:' + b64 + '}\n}',
+            JsonContainerDecoder().encode_root_object(data))
+
+    def test_lazy_base64(self):
+        b64 = 'QUJD' * 48
+        text = '{2,\n{#base64:' + b64[:64] + '\n' + b64[64:128] + '\n' + b64[128:] + '}\n},\n{3,\n{#base64:QUJD}\n}'
+        data = JsonContainerDecoder(lazy_base64=True).decode_file(io.StringIO(text))
+        blob = data[0][1][0]
+        self.assertIsInstance(blob, Base64Blob)
+        self.assertEqual('#base64:' + b64, str(blob))
+        self.assertEqual('##base64:QUJD', str(data[1][1][0]))
+        self.assertEqual(JsonContainerDecoder().decode_file(io.StringIO(text)), [
+            [data[0][0], [str(blob)]], [data[1][0], [str(data[1][1][0])]]])
+        bin_data = io.BytesIO()
+        blob.decode_to(bin_data)
+        self.assertEqual(b'ABC' * 48, bin_data.getvalue())
+
+        helper.bin_write(blob, self.temp_dir, 'lazy_base64.bin')
+        file_blob = Base64Blob.from_file(self.temp_dir, 'lazy_base64.bin')
+        self.assertEqual(
+            JsonContainerDecoder().encode_root_object([['1', ['#base64:' + b64]]]),
+            JsonContainerDecoder().encode_root_object([['1', [file_blob]]]))
+
+    def test_read_encoding(self):
+        text = '{1,"Строка",\n{2}\n}'
+        for encoding, raw in (('utf-8-sig', text.encode('utf-8-sig')), ('utf-8-sig', text.encode('utf-8')),
+                              ('windows-1251', text.replace('\n', '\r\n').encode('windows-1251'))):
+            helper.bin_write(raw, self.temp_dir, 'encoding')
+            self.assertEqual((text, encoding), helper.brace_text_read(self.temp_dir, 'encoding'))
+            self.assertEqual([['1', '"Строка"', ['2']]], helper.brace_file_read(self.temp_dir, 'encoding'))
+
+    def test_read_cache(self):
+        helper.brace_file_cache_clear()
+        helper.txt_write('{1,"a",\n{2}\n}', self.temp_dir, 'cache')
+        data = helper.brace_file_read(self.temp_dir, 'cache')
+        data[0][2].append('3')
+        self.assertEqual([['1', '"a"', ['2']]], helper.brace_file_read(self.temp_dir, 'cache'))
+        self.assertEqual(dict(hits=1, misses=1, size=1, total_size=13), helper.brace_file_cache_info())
+
+        helper.txt_write('{1,"bb",\n{2}\n}', self.temp_dir, 'cache')
+        self.assertEqual([['1', '"bb"', ['2']]], helper.brace_file_read(self.temp_dir, 'cache'))
+        self.assertEqual(dict(hits=1, misses=2, size=1, total_size=14), helper.brace_file_cache_info())
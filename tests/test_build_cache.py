@@ -0,0 +1,71 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.append("../../src/")
+from v8unpack import helper, extract, build
+from v8unpack.build_cache import BuildCache, ENTRY_SIZE_FILE
+from v8unpack.ext_exception import ExtException
+from v8unpack.unittest_helper import read_dir
+
+
+class TestBuildCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.current_dir = os.path.dirname(__file__)
+        self.temp_dir = os.path.join(self.current_dir, 'data', 'temp', 'build_cache')
+        helper.clear_dir(self.temp_dir)
+
+    def test_build(self):
+        src_dir = os.path.join(self.temp_dir, 'src')
+        cache_dir = os.path.join(self.temp_dir, 'cache')
+        extract(os.path.join(self.current_dir, 'Configuration803', '1Cv8.cf'), src_dir,
+                temp_dir=os.path.join(self.temp_dir, 'extract'))
+
+        expected = self.build(src_dir, 'full', {})
+        self.assertEqual(expected, self.build(src_dir, 'cold', {'cache': cache_dir}))
+        self.assertTrue(os.listdir(os.path.join(cache_dir, 'build')))
+        self.assertEqual(expected, self.build(src_dir, 'warm', {'cache': cache_dir}))
+
+        # изменился вложенный объект - родитель собирается заново, остальные берутся из кэша
+        with open(os.path.join(src_dir, 'Enum', 'Перечисление1', 'EnumCommand', 'КомандаПеречисления',
+                               'EnumCommand.obj.bsl'), 'a', encoding='utf-8') as file:
+            file.write('\n// изменение\n')
+        self.assertEqual(self.build(src_dir, 'changed-full', {}), self.build(src_dir, 'changed', {'cache': cache_dir}))
+
+        # ошибка сборки вложенного объекта - сборка прерывается, в кэш и папку сборки ничего не попадает
+        cache_entries = sorted(os.listdir(os.path.join(cache_dir, 'build')))
+        with open(os.path.join(src_dir, 'Enum', 'Перечисление1', 'EnumCommand', 'КомандаПеречисления',
+                               'EnumCommand.json'), 'w', encoding='utf-8') as file:
+            file.write('{')
+        with self.assertRaises(ExtException):
+            self.build(src_dir, 'error', {'cache': cache_dir})
+        self.assertEqual({}, read_dir(os.path.join(self.temp_dir, 'error', 'encode_stage_1')))
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir, 'error', '1Cv8.cf')))
+        self.assertEqual(cache_entries, sorted(os.listdir(os.path.join(cache_dir, 'build'))))
+
+    def test_evict(self):
+        src_dir = os.path.join(self.temp_dir, 'src')
+        cache_dir = os.path.join(self.temp_dir, 'cache')
+        extract(os.path.join(self.current_dir, 'Configuration803', '1Cv8.cf'), src_dir,
+                temp_dir=os.path.join(self.temp_dir, 'extract'))
+        self.build(src_dir, 'cold', {'cache': cache_dir})
+        build_cache = BuildCache.from_options({'cache': cache_dir})
+        entries = os.listdir(build_cache.cache_dir)
+        self.assertTrue(entries)
+        for entry in entries:
+            files = read_dir(os.path.join(build_cache.cache_dir, entry), exclude=(ENTRY_SIZE_FILE,))
+            self.assertEqual(sum(len(data) for data in files.values()),
+                             int(helper.txt_read(os.path.join(build_cache.cache_dir, entry), ENTRY_SIZE_FILE)))
+
+        # размеры записей берутся из файлов size, файлы записей не обходятся
+        build_cache.max_size = 0
+        with mock.patch('v8unpack.build_cache.os.walk', side_effect=AssertionError('os.walk')):
+            build_cache.evict()
+        self.assertEqual([], os.listdir(build_cache.cache_dir))
+
+    def build(self, src_dir, name, options):
+        temp_dir = os.path.join(self.temp_dir, name)
+        build(src_dir, os.path.join(temp_dir, '1Cv8.cf'), temp_dir=temp_dir, options=options)
+        # versions заполняется случайными идентификаторами, configinfo - контрольными суммами
+        return read_dir(os.path.join(temp_dir, 'encode_stage_1'), exclude=('versions', 'configinfo'))
@@ -0,0 +1,64 @@
+import os
+import sys
+import unittest
+
+sys.path.append("../../src/")
+from v8unpack import helper
+from v8unpack.container_cache import ContainerIndexCache
+from v8unpack.container_index import ContainerIndex
+from v8unpack.container_reader import extract as container_extract
+from v8unpack.format_1c.types import build_type_maps
+from v8unpack.unittest_helper import read_dir
+
+
+class TestContainerIndexCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.current_dir = os.path.dirname(__file__)
+        self.data_dir = os.path.join(self.current_dir, 'data')
+        self.temp_dir = os.path.join(self.data_dir, 'temp')
+        self.cache_dir = os.path.join(self.temp_dir, 'index-cache')
+        self.src_filename = os.path.join(self.current_dir, 'Configuration803', '1Cv8.cf')
+        helper.clear_dir(self.cache_dir)
+
+    def test_extract(self):
+        dest_dir = os.path.join(self.temp_dir, 'cache-1Cv8')
+        cached_dest_dir = os.path.join(self.temp_dir, 'cache-1Cv8-cached')
+        container_extract(self.src_filename, dest_dir, cache_dir=self.cache_dir)
+        cache = ContainerIndexCache(self.cache_dir)
+        self.assertIsNotNone(cache.load(self.src_filename))
+        container_extract(self.src_filename, cached_dest_dir, cache_dir=self.cache_dir)
+        self.assertEqual(read_dir(dest_dir), read_dir(cached_dest_dir))
+
+    def test_nested(self):
+        with ContainerIndex(self.src_filename, cache_dir=self.cache_dir) as index:
+            nested = [elem for elem in index.listdir() if index.isdir(elem)]
+            expected = {elem: index.listdir(elem) for elem in nested}
+        data = ContainerIndexCache(self.cache_dir).load(self.src_filename)
+        self.assertEqual(len(nested), len(data['nested']))
+        with ContainerIndex(self.src_filename, cache_dir=self.cache_dir) as index:
+            for elem in nested:
+                self.assertEqual(expected[elem], index.listdir(elem))
+                for file_name in expected[elem]:
+                    index.read(f'{elem}/{file_name}')
+
+    def test_evict(self):
+        ContainerIndex(self.src_filename, cache_dir=self.cache_dir).close()
+        cache = ContainerIndexCache(self.cache_dir, max_size=0)
+        cache.evict()
+        self.assertIsNone(cache.load(self.src_filename))
+
+    def test_type_maps(self):
+        src_dir = os.path.join(self.temp_dir, 'cache-types')
+        helper.clear_dir(src_dir)
+        header = {'name': 'Товары', 'header': [['1', ['0', '', '', 'catalog-type-uuid']]]}
+        helper.json_write(header, os.path.join(src_dir, 'Catalog', 'Товары'), 'Catalog.json')
+        expected = {'catalog_ref': {'catalog-type-uuid': 'Товары'}, 'document_ref': {}, 'defined_type': {}}
+        self.assertEqual(expected, build_type_maps(src_dir, cache_dir=self.cache_dir))
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+        self.assertEqual(expected, build_type_maps(src_dir, cache_dir=self.cache_dir))
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+
+        header['name'] = 'Номенклатура'
+        helper.json_write(header, os.path.join(src_dir, 'Catalog', 'Товары'), 'Catalog.json')
+        self.assertEqual('Номенклатура', build_type_maps(src_dir, cache_dir=self.cache_dir)['catalog_ref'][
+            'catalog-type-uuid'])
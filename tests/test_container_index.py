@@ -0,0 +1,75 @@
+import mmap
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.append("../../src/")
+from v8unpack.container_doc import Document
+from v8unpack.container_index import ContainerIndex
+from v8unpack.container_reader import extract as container_extract
+
+
+class TestContainerIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        self.current_dir = os.path.dirname(__file__)
+        self.data_dir = os.path.join(self.current_dir, 'data')
+        self.temp_dir = os.path.join(self.data_dir, 'temp')
+
+    def test_read(self):
+        src_filename = os.path.join(self.current_dir, 'Configuration803', '1Cv8.cf')
+        dest_dir = os.path.join(self.temp_dir, 'index-1Cv8')
+        container_extract(src_filename, dest_dir)
+        dest_dir = os.path.join(dest_dir, '0')
+        with ContainerIndex(src_filename) as index:
+            self.assertEqual(sorted(os.listdir(dest_dir)), sorted(index.listdir()))
+            self.assert_equal_dir(index, dest_dir, '')
+
+    def test_not_found(self):
+        src_filename = os.path.join(self.current_dir, 'Configuration803', '1Cv8.cf')
+        with ContainerIndex(src_filename) as index:
+            with self.assertRaises(FileNotFoundError):
+                index.read('not_exists')
+            with self.assertRaises(NotADirectoryError):
+                index.listdir('root')
+
+    def test_mapping_closed(self):
+        src_filename = os.path.join(self.current_dir, 'Configuration803', '1Cv8.cf')
+        mapped = []
+
+        def open_mmap(*args, **kwargs):
+            mapped.append(mmap_class(*args, **kwargs))
+            return mapped[-1]
+
+        mmap_class = mmap.mmap
+        with mock.patch('mmap.mmap', open_mmap):
+            with mock.patch.object(Document, 'read_block_view', autospec=True,
+                                   side_effect=Document.read_block_view) as read_block_view:
+                index = ContainerIndex(src_filename)
+            with index:
+                root = index._containers[''][0]
+                # при открытии читаются только оглавление и начала файлов, а не все блоки бинарника
+                self.assertTrue(0 < read_block_view.call_count <= 3 * len(root.files))
+                nested_dirs = [name for name in index.listdir() if index.isdir(name)]
+                self.assertTrue(nested_dirs)
+                for name in nested_dirs:
+                    for nested_name in index.listdir(name):
+                        index.read(f'{name}/{nested_name}')
+            self.assertTrue(mapped[0].closed)
+            with self.assertRaises(FileNotFoundError):
+                with ContainerIndex(src_filename) as index:
+                    index.read(f'{nested_dirs[0]}/not_exists')
+        self.assertEqual(2, len(mapped))
+        self.assertTrue(mapped[1].closed)
+
+    def assert_equal_dir(self, index, dest_dir, path):
+        for entry in os.listdir(os.path.join(dest_dir, path)):
+            entry_path = f'{path}/{entry}' if path else entry
+            if os.path.isdir(os.path.join(dest_dir, entry_path)):
+                self.assertTrue(index.isdir(entry_path))
+                self.assertEqual(sorted(os.listdir(os.path.join(dest_dir, entry_path))),
+                                 sorted(index.listdir(entry_path)))
+                self.assert_equal_dir(index, dest_dir, entry_path)
+                continue
+            with open(os.path.join(dest_dir, entry_path), 'rb') as f:
+                self.assertEqual(f.read(), index.read(entry_path), entry_path)
@@ -1,10 +1,19 @@
+import mmap
 import os
 import sys
 import unittest
+import zipfile
+from unittest import mock
 
 sys.path.append("../../src/")
-from v8unpack.container_reader import extract as container_extract, decompress_and_extract
-from v8unpack.container_writer import build as container_build, compress_and_build
+from v8unpack import helper, extract, build
+from v8unpack.container_reader import extract as container_extract, decompress_and_extract, \
+    open_container_file, get_container_file, close_container_files
+from v8unpack.container_writer import build as container_build, compress_and_build, compress_and_build_file, \
+    calc_sha1
+from v8unpack.container_doc import BUFFER_CHUNK_SIZE
+from v8unpack.decoder import encode
+from v8unpack.unittest_helper import read_dir
 
 
 class TestFileOrganizerCE(unittest.TestCase):
@@ -20,6 +29,113 @@ class TestFileOrganizerCE(unittest.TestCase):
         container_extract(src_filename, dest_dir0, False, False)
         decompress_and_extract(dest_dir0, dest_dir1)
 
+    def test_extract_mmap(self):
+        src_filename = os.path.join(self.data_dir, 'apam.cf')
+        dest_dir_mmap = os.path.join(self.temp_dir, 'apam-mmap')
+        dest_dir_file = os.path.join(self.temp_dir, 'apam-file')
+        container_extract(src_filename, dest_dir_mmap, False, False, reader='mmap')
+        container_extract(src_filename, dest_dir_file, False, False, reader='file')
+        self.assert_equal_dirs(dest_dir_file, dest_dir_mmap)
+
+    def test_mapping_closed(self):
+        src_filename = os.path.join(self.data_dir, 'apam.cf')
+        mapped = []
+
+        def open_mmap(*args, **kwargs):
+            mapped.append(mmap_class(*args, **kwargs))
+            return mapped[-1]
+
+        mmap_class = mmap.mmap
+        with mock.patch('mmap.mmap', open_mmap):
+            container_extract(src_filename, os.path.join(self.temp_dir, 'apam-closed'))
+            with self.assertRaises(ZeroDivisionError):
+                with open_container_file(src_filename) as view:
+                    data = view[:10]
+                    1 / 0
+        self.assertEqual(2, len(mapped))
+        self.assertTrue(mapped[0].closed)
+
+    def test_container_file_cache(self):
+        src_filename = os.path.join(self.data_dir, 'apam.cf')
+        mapped = []
+
+        def open_mmap(*args, **kwargs):
+            mapped.append(mmap_class(*args, **kwargs))
+            return mapped[-1]
+
+        mmap_class = mmap.mmap
+        with mock.patch('mmap.mmap', open_mmap):
+            view = get_container_file(src_filename)
+            self.assertIs(view, get_container_file(src_filename))
+            self.assertEqual(1, len(mapped))
+            get_container_file(os.path.join(self.data_dir, 'apam_old.cf'))
+            self.assertTrue(mapped[0].closed)
+            close_container_files()
+        self.assertEqual(2, len(mapped))
+        self.assertTrue(mapped[1].closed)
+
+    def test_extract_single_pass(self):
+        src_filename = os.path.join(self.data_dir, 'apam.cf')
+        dest_dir0 = os.path.join(self.temp_dir, 'apam-0')
+        dest_dir1 = os.path.join(self.temp_dir, 'apam-1')
+        dest_dir_single = os.path.join(self.temp_dir, 'apam-single')
+        container_extract(src_filename, dest_dir0, False, False)
+        decompress_and_extract(dest_dir0, dest_dir1)
+        container_extract(src_filename, dest_dir_single)
+        self.assert_equal_dirs(dest_dir1, dest_dir_single)
+
+    def test_extract_pool(self):
+        src_filename = os.path.join(self.data_dir, 'apam.cf')
+        dest_dir0 = os.path.join(self.temp_dir, 'apam-0')
+        dest_dir1 = os.path.join(self.temp_dir, 'apam-1')
+        dest_dir_pool = os.path.join(self.temp_dir, 'apam-pool')
+        container_extract(src_filename, dest_dir0, False, False)
+        decompress_and_extract(dest_dir0, dest_dir1)
+        pool = helper.get_pool(processes=2)
+        try:
+            container_extract(src_filename, dest_dir_pool, pool=pool)
+        finally:
+            helper.close_pool(pool)
+        self.assert_equal_dirs(dest_dir1, dest_dir_pool)
+
+    def test_compress_and_build_pool(self):
+        src_filename = os.path.join(self.current_dir, 'ConfigurationExtension803', 'Расширение1.cfe')
+        temp_dir = os.path.join(self.temp_dir, 'compress-pool')
+        helper.clear_dir(temp_dir)
+        extract(src_filename, os.path.join(temp_dir, 'src'), temp_dir=os.path.join(temp_dir, 'extract'))
+        stage1_dir = os.path.join(temp_dir, 'encode_stage_1')
+        encode(os.path.join(temp_dir, 'extract', 'decode_stage_3'), stage1_dir, options={})
+        # calc_sha1 дописывает контрольные суммы в исходник configinfo, перед второй сборкой он восстанавливается.
+        # Копировать исходники нельзя: в атрибуты файлов вложенных контейнеров попадает время их создания
+        configinfo_dir = os.path.join(stage1_dir, '0')
+        configinfo = helper.bin_read(configinfo_dir, 'configinfo')
+        pool_dest_dir = os.path.join(temp_dir, 'pool-stage0')
+        pool = helper.get_pool(processes=2)
+        try:
+            compress_and_build(stage1_dir, pool_dest_dir, pool=pool)
+        finally:
+            helper.close_pool(pool)
+        pool_configinfo = helper.bin_read(configinfo_dir, 'configinfo')
+        self.assertNotEqual(configinfo, pool_configinfo)
+
+        # последовательная сборка в основном процессе
+        with open(os.path.join(configinfo_dir, 'configinfo'), 'wb') as file:
+            file.write(configinfo)
+        dest_dir = os.path.join(temp_dir, 'stage0')
+        for dir_name in sorted(os.listdir(stage1_dir)):
+            _src_dir = os.path.join(stage1_dir, dir_name)
+            _dest_dir = os.path.join(dest_dir, dir_name)
+            helper.clear_dir(_dest_dir)
+            for filename in sorted(os.listdir(_src_dir)):
+                compress_and_build_file((_src_dir, filename, _dest_dir, BUFFER_CHUNK_SIZE, None))
+            calc_sha1(_src_dir, _dest_dir)
+
+        self.assertEqual(pool_configinfo, helper.bin_read(configinfo_dir, 'configinfo'))
+        self.assertEqual(read_dir(dest_dir, dirs=True), read_dir(pool_dest_dir, dirs=True))
+
+    def assert_equal_dirs(self, dir1, dir2):
+        self.assertEqual(read_dir(dir1, dirs=True), read_dir(dir2, dirs=True), dir1)
+
     def test_extract_16(self):
         src_filename = os.path.join(self.data_dir, 'apam.cf')
         dst_filename = os.path.join(self.temp_dir, 'apam.cf')
@@ -33,4 +149,71 @@ class TestFileOrganizerCE(unittest.TestCase):
         compress_and_build(dest_dir1, dest_dir2)
         container_build(dest_dir2, dst_filename, True, version='80316')
 
+    def test_build_two_containers(self):
+        src_filename = os.path.join(self.data_dir, 'apam.cf')
+        dst_filename = os.path.join(self.temp_dir, 'apam-build.cf')
+        dest_dir0 = os.path.join(self.temp_dir, 'apam-build-0')
+        dest_dir1 = os.path.join(self.temp_dir, 'apam-build-1')
+        dest_dir2 = os.path.join(self.temp_dir, 'apam-build-2')
+        container_extract(src_filename, dest_dir0, False, False)
+        self.assertEqual(len(os.listdir(dest_dir0)), 2)
+        container_build(dest_dir0, dst_filename, True)
+        container_extract(dst_filename, dest_dir1, False, False)
+        self.assert_equal_dirs(dest_dir0, dest_dir1)
+        container_build(dest_dir1, dst_filename, True)
+        container_extract(dst_filename, dest_dir2)
+        container_extract(src_filename, dest_dir1)
+        self.assert_equal_dirs(dest_dir1, dest_dir2)
+
+    def test_build_inflate(self):
+        src_filename = os.path.join(self.current_dir, 'Configuration803', '1Cv8.cf')
+        dst_filename = os.path.join(self.temp_dir, 'inflate.cf')
+        dest_dir0 = os.path.join(self.temp_dir, 'inflate-0')
+        dest_dir1 = os.path.join(self.temp_dir, 'inflate-1')
+        container_extract(src_filename, dest_dir0)
+        # вложенные контейнеры распакованы в подкаталоги, при сборке со сжатием они сжимаются целиком
+        self.assertTrue(any(_dirs for path, _dirs, files in os.walk(os.path.join(dest_dir0, '0'))))
+        # сжатые данные пишутся сразу в контейнер, без временных файлов
+        with mock.patch('v8unpack.container.tempfile.TemporaryFile', side_effect=AssertionError('TemporaryFile')):
+            container_build(dest_dir0, dst_filename, False)
+        container_extract(dst_filename, dest_dir1)
+        self.assert_equal_dirs(dest_dir0, dest_dir1)
+
+    def test_build_roundtrip(self):
+        for src_filename, config_file in (
+                (os.path.join(self.current_dir, 'Configuration803', '1Cv8.cf'), 'Configuration.json'),
+                (os.path.join(self.current_dir, 'ConfigurationExtension803', 'Расширение1.cfe'),
+                 'ConfigurationExtension.json'),
+                (os.path.join(self.data_dir, 'apam.cf'), 'Configuration.json')):
+            with self.subTest(src_filename=src_filename):
+                name = os.path.basename(src_filename)
+                temp_dir = os.path.join(self.temp_dir, 'roundtrip', name)
+                src_dir = os.path.join(temp_dir, 'src')
+                dest_dir = os.path.join(temp_dir, 'dest')
+                dst_filename = os.path.join(temp_dir, 'build', name)
+                helper.clear_dir(temp_dir)
+                extract(src_filename, src_dir, temp_dir=os.path.join(temp_dir, 'extract'))
+                build(src_dir, dst_filename, temp_dir=os.path.join(temp_dir, 'build'))
+                extract(dst_filename, dest_dir, temp_dir=os.path.join(temp_dir, 'extract-build'))
+
+                # versions заполняется при сборке случайными идентификаторами, configinfo - контрольными суммами
+                src_config = helper.json_read(src_dir, config_file)
+                dest_config = helper.json_read(dest_dir, config_file)
+                for key in ('versions', 'configinfo'):
+                    src_config.pop(key, None)
+                    dest_config.pop(key, None)
+                self.assertEqual(src_config, dest_config)
+                # в dummy.zip попадает время файлов, поэтому архивы сравниваются по содержимому
+                exclude = (config_file, 'dummy.zip')
+                self.assertEqual(read_dir(src_dir, exclude=exclude), read_dir(dest_dir, exclude=exclude))
+                self.assertEqual(self.read_zip(src_dir), self.read_zip(dest_dir))
+
+    @staticmethod
+    def read_zip(dir_name):
+        path = os.path.join(dir_name, 'dummy.zip')
+        if not os.path.isfile(path):
+            return None
+        with zipfile.ZipFile(path) as archive:
+            return {name: archive.read(name) for name in archive.namelist()}
+
 #[(559, 686), (2451, 2578), (3121, 3184), (3727, 3796), (4339, 4410)]
\ No newline at end of file
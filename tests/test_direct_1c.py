@@ -0,0 +1,42 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.append("../../src/")
+from v8unpack import helper
+from v8unpack.container_reader import extract as container_extract
+from v8unpack.direct_1c import extract_1c_direct
+from v8unpack.unittest_helper import read_dir
+
+
+def run_sequential(method, list_args, pool=None, title=None, need_result=False):
+    result = []
+    for task in list_args:
+        res = method(task)
+        if need_result and res:
+            result.extend(res)
+    return result
+
+
+class TestDirect1C(unittest.TestCase):
+    def setUp(self) -> None:
+        self.current_dir = os.path.dirname(__file__)
+        self.temp_dir = os.path.join(self.current_dir, 'data', 'temp', 'direct-1c')
+        helper.clear_dir(self.temp_dir)
+
+    def test_extract_pool(self):
+        src_dir = os.path.join(self.temp_dir, 'decode_stage_1')
+        container_extract(os.path.join(self.current_dir, 'Configuration803', '1Cv8.cf'), src_dir)
+        dest_dir = os.path.join(self.temp_dir, 'sequential')
+        with mock.patch('v8unpack.direct_1c.decoder.helper.run_in_pool', run_sequential):
+            extract_1c_direct(src_dir, dest_dir)
+        pool_dest_dir = os.path.join(self.temp_dir, 'pool')
+        pool = helper.get_pool(processes=2)
+        try:
+            extract_1c_direct(src_dir, pool_dest_dir, pool=pool)
+        finally:
+            helper.close_pool(pool)
+        result = read_dir(dest_dir, dirs=True)
+        self.assertTrue(result)
+        self.assertEqual(result, read_dir(pool_dest_dir, dirs=True))
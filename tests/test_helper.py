@@ -1,11 +1,39 @@
+import os
 import sys
+import tempfile
+import time
 import unittest
+from unittest import mock
 
 from v8unpack import helper
+from v8unpack.ext_exception import ExtException
 
 sys.path.append("../../src/")
 
 
+def split_task(size):
+    if size < 0:
+        raise ExtException(message='Отрицательный размер')
+    return [size // 2, size - size // 2] if size > 1 else []
+
+
+def slow_task(params):
+    path, name = params
+    if name == 'fail':
+        raise ExtException(message='Ошибка задания')
+    if name == 'exit':
+        os._exit(1)
+    time.sleep(0.2)
+    with open(os.path.join(path, name), 'w'):
+        pass
+    return []
+
+
+@helper.task_cost(lambda size: size)
+def sized_task(size):
+    return [size]
+
+
 class TestHelper(unittest.TestCase):
     def test_get_extension_from_comment(self):
         data = [
@@ -35,3 +63,62 @@ class TestHelper(unittest.TestCase):
                 self.assertFalse(elem[2])
             except AssertionError:
                 self.assertTrue(elem[2])
+
+    def test_run_in_pool_tree(self):
+        pool = helper.get_pool(processes=2)
+        try:
+            done = []
+
+            def get_child_tasks(task, tasks):
+                done.append(task)
+                return tasks
+
+            helper.run_in_pool_tree(split_task, [8, 3], pool, get_child_tasks=get_child_tasks)
+            self.assertEqual(15 + 5, len(done))
+            self.assertEqual(11, done.count(1))
+            with self.assertRaises(ExtException):
+                helper.run_in_pool_tree(split_task, [4, -1], pool)
+        finally:
+            helper.close_pool(pool)
+
+    def test_run_in_pool_tree_error(self):
+        pool = helper.get_pool(processes=2)
+        try:
+            with tempfile.TemporaryDirectory() as path:
+                tasks = [(path, 'fail')] + [(path, str(i)) for i in range(20)]
+                with self.assertRaises(ExtException):
+                    helper.run_in_pool_tree(slow_task, tasks, pool)
+                # после ошибки задания дерева в пуле не выполняются: отправленные дождались, остальные отменены
+                done = len(os.listdir(path))
+                self.assertLess(done, 20)
+                time.sleep(0.5)
+                self.assertEqual(done, len(os.listdir(path)))
+
+                begin = time.monotonic()
+                with self.assertRaises(ExtException):
+                    helper.run_in_pool_tree(slow_task, [(path, 'exit')], pool)
+                self.assertLess(time.monotonic() - begin, 10 * helper.POOL_POLL_TIMEOUT)
+        finally:
+            helper.close_pool(pool)
+
+    def test_get_task_chunks(self):
+        costs = [1, helper.TASK_COST_OVERHEAD * 100, 2, helper.TASK_COST_OVERHEAD * 10, 3] + [0] * 200
+        chunks = helper.get_task_chunks(list(range(len(costs))), lambda task: costs[task], processes=2)
+        self.assertEqual([1], chunks[0])  # самое дорогое задание первым и отдельно
+        self.assertEqual(list(range(len(costs))), sorted(task for chunk in chunks for task in chunk))
+        self.assertTrue(all(len(chunk) <= helper.MAX_CHUNK_LENGTH for chunk in chunks))
+        self.assertLess(len(chunks), len(costs) // 2)
+
+    def test_run_in_pool_chunks(self):
+        pool = helper.get_pool(processes=2)
+        try:
+            with mock.patch('v8unpack.helper.get_task_chunks', wraps=helper.get_task_chunks) as get_task_chunks:
+                result = helper.run_in_pool(sized_task, list(range(100)), pool, need_result=True)
+            self.assertEqual(list(range(100)), sorted(result))
+            self.assertEqual(2, get_task_chunks.call_args.args[2])  # пачки считаются на процессы пула
+        finally:
+            helper.close_pool(pool)
+
+    def test_init_pool_worker(self):
+        helper.init_pool_worker()
+        self.assertIn('v8unpack.MetaDataObject.CatalogForm', sys.modules)
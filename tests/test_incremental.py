@@ -0,0 +1,45 @@
+import os
+import sys
+import unittest
+import zipfile
+
+sys.path.append("../../src/")
+from v8unpack import helper, extract
+from v8unpack.unittest_helper import read_dir
+
+
+class TestIncrementalExtract(unittest.TestCase):
+    def setUp(self) -> None:
+        self.current_dir = os.path.dirname(__file__)
+        self.data_dir = os.path.join(self.current_dir, 'data')
+        self.temp_dir = os.path.join(self.data_dir, 'temp', 'incremental')
+        helper.clear_dir(self.temp_dir)
+
+    def test_extract(self):
+        out_dir = os.path.join(self.temp_dir, 'src')
+        temp_dir = os.path.join(self.temp_dir, 'temp')
+        options = {'incremental': True}
+        files = [
+            os.path.join(self.current_dir, 'Configuration803', '1Cv8.cf'),
+            os.path.join(self.current_dir, 'Configuration803', '1Cv8.cf'),  # ничего не изменилось
+            os.path.join(self.data_dir, 'apam.cf'),  # все объекты удалены и добавлены новые
+            os.path.join(self.current_dir, 'Configuration803', '1Cv8-16.cf'),
+        ]
+        for i, file_name in enumerate(files):
+            extract(file_name, out_dir, temp_dir=temp_dir, options=dict(options))
+            full_out_dir = os.path.join(self.temp_dir, f'full-{i}')
+            extract(file_name, full_out_dir, temp_dir=os.path.join(self.temp_dir, f'full-temp-{i}'))
+            # в dummy.zip попадает время файлов, поэтому архивы сравниваются по содержимому
+            self.assertEqual(read_dir(full_out_dir, exclude=('dummy.zip',)), read_dir(out_dir, exclude=('dummy.zip',)),
+                             file_name)
+            self.assertEqual(self.read_zip(full_out_dir), self.read_zip(out_dir), file_name)
+        self.assertTrue(os.path.isfile(os.path.join(temp_dir, 'decode_stage_3.manifest.json')))
+        self.assertTrue(os.path.isfile(os.path.join(temp_dir, 'unpack.manifest.json')))
+
+    @staticmethod
+    def read_zip(dir_name):
+        path = os.path.join(dir_name, 'dummy.zip')
+        if not os.path.isfile(path):
+            return None
+        with zipfile.ZipFile(path) as archive:
+            return {name: archive.read(name) for name in archive.namelist()}
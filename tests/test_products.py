@@ -0,0 +1,37 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.append("../../src/")
+from v8unpack import helper, extract, extract_all
+from v8unpack.unittest_helper import read_dir
+
+
+class TestProducts(unittest.TestCase):
+    def setUp(self) -> None:
+        self.current_dir = os.path.dirname(__file__)
+        self.temp_dir = os.path.join(self.current_dir, 'data', 'temp', 'products')
+        helper.clear_dir(self.temp_dir)
+
+    def test_extract_all_parallel(self):
+        files = {
+            'conf': os.path.join(self.current_dir, 'Configuration803', '1Cv8.cf'),
+            'ext': os.path.join(self.current_dir, 'ConfigurationExtension803', 'Расширение1.cfe'),
+        }
+        products = {
+            product: dict(bin=file_name, src=os.path.join(self.temp_dir, product),
+                          temp=os.path.join(self.temp_dir, 'temp'))  # общая временная папка
+            for product, file_name in files.items()
+        }
+        product_file_name = os.path.join(self.temp_dir, 'products.json')
+        with open(product_file_name, 'w', encoding='utf-8') as file:
+            json.dump(products, file)
+        extract_all(product_file_name, processes=2, parallel=2)
+
+        for product, file_name in files.items():
+            expected_dir = os.path.join(self.temp_dir, 'expected', product)
+            extract(file_name, expected_dir, temp_dir=os.path.join(self.temp_dir, 'expected', f'{product}-temp'))
+            self.assertEqual(read_dir(expected_dir), read_dir(os.path.join(self.temp_dir, product)))
+            self.assertTrue(os.path.isdir(os.path.join(self.temp_dir, 'temp', product)))
+            self.assertTrue(os.path.isfile(os.path.join(self.temp_dir, 'log', f'{product}.extract.log')))